@@ -0,0 +1,299 @@
+"""Servicio HTTP de análisis de zonas en segundo plano.
+
+Los trabajos se encolan y se ejecutan en un pool acotado de hilos dentro del mismo proceso, de modo que
+todos comparten el modelo YOLO ya cargado y las cachés de imágenes y evaluaciones.
+
+    uvicorn api:app --host 0.0.0.0 --port 8000
+
+    POST   /estimate                   estimación previa de llamadas y costo para los mismos parámetros
+    POST   /jobs                       crea un trabajo {latitud, longitud, distancia, step, circular, resume, adaptive, budget, streets}
+    GET    /jobs                       lista de trabajos
+    GET    /jobs/{id}                  estado y avance
+    GET    /jobs/{id}/events           avance como Server-Sent Events hasta que el trabajo termina
+    GET    /jobs/{id}/results          resultados con IPLU (JSON, o CSV con ?format=csv)
+    GET    /jobs/{id}/streets          IPLU por tramo de calle de un trabajo con streets=true
+    GET    /jobs/{id}/images/{nombre}  panorámica de un punto (?thumbnail=true para la miniatura)
+    DELETE /jobs/{id}                  cancela un trabajo que sigue en cola
+"""
+import asyncio
+import concurrent.futures
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel, Field
+
+from iplu_helper import agregar_iplu
+from osm_helper import RedVial
+from storage_helper import PanoramaArchive, archive_ref, image_mime, image_name, read_image
+from vision_helper import Basuras, VisionYolo
+
+
+class JobRequest(BaseModel):
+    latitud: float = Field(ge=-90, le=90)
+    longitud: float = Field(ge=-180, le=180)
+    distancia: float = Field(gt=0, le=20000)
+    step: float = Field(gt=0)
+    circular: bool = False
+    resume: bool = True
+    adaptive: bool = False
+    budget: int | None = Field(default=None, ge=0)
+    streets: bool = False
+
+
+class Job():
+    """Estado de un trabajo; `progress` apunta al diccionario de avance del `Basuras` en ejecución."""
+
+    def __init__(self, request):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.status = "queued"
+        self.progress = {"done": 0, "total": 0}
+        self.error = None
+        self.results_folder = None
+        self.df = None
+        self.df_streets = None
+        self.images = {}
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+
+    @property
+    def terminal(self):
+        return self.status in ("completed", "failed", "cancelled")
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "request": self.request.model_dump(),
+            "progress": dict(self.progress),
+            "error": self.error,
+            "created": self.created,
+            "started": self.started,
+            "finished": self.finished,
+            "rows": None if self.df is None else len(self.df),
+        }
+
+
+class JobManager():
+    """Cola acotada de trabajos sobre un pool de hilos; conserva los últimos `history` trabajos terminados."""
+    __WORKERS = int(os.getenv("JOBS_WORKERS", "2"))
+    __MAX_PENDING = int(os.getenv("JOBS_MAX_PENDING", "16"))
+    __HISTORY = int(os.getenv("JOBS_HISTORY", "100"))
+
+    def __init__(self, workers=None, max_pending=None, history=None):
+        self.workers = workers or self.__WORKERS
+        self.max_pending = max_pending or self.__MAX_PENDING
+        self.history = history or self.__HISTORY
+        self.__jobs = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="job")
+
+    def submit(self, request):
+        with self.__lock:
+            pending = sum(1 for job in self.__jobs.values() if not job.terminal)
+            if pending >= self.max_pending:
+                return None
+            job = Job(request)
+            # El futuro existe antes de publicar el trabajo: un DELETE inmediato siempre puede cancelarlo
+            job.future = self.__executor.submit(self.__run, job)
+            self.__jobs[job.id] = job
+            self.__prune()
+        return job
+
+    def __prune(self):
+        finished = [job_id for job_id, job in self.__jobs.items() if job.terminal]
+        for job_id in finished[:max(0, len(finished) - self.history)]:
+            del self.__jobs[job_id]
+
+    def __run(self, job):
+        job.status = "running"
+        job.started = time.time()
+        try:
+            basuras = Basuras()
+            job.progress = basuras.progress
+            request = job.request
+            for _ in basuras.iterar_basuras_en_zona(f"{request.latitud:.6f}", f"{request.longitud:.6f}", request.distancia,
+                                                    request.step, circular=request.circular, resume=request.resume,
+                                                    adaptive=request.adaptive, budget=request.budget,
+                                                    streets=request.streets):
+                job.progress = basuras.progress
+                job.results_folder = basuras.results_folder
+            job.df = agregar_iplu(basuras.df)
+            job.df_streets = basuras.df_streets
+            # Las filas reutilizadas apuntan a imágenes de ejecuciones anteriores: se sirve su referencia guardada
+            job.images = {image_name(ref): ref for ref in job.df["Image"].dropna() if ref != "ERROR"}
+            job.status = "completed"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+
+    def get(self, job_id):
+        with self.__lock:
+            return self.__jobs.get(job_id)
+
+    def list(self):
+        with self.__lock:
+            return list(self.__jobs.values())
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is None or job.future is None or not job.future.cancel():
+            return False
+        job.status = "cancelled"
+        job.finished = time.time()
+        return True
+
+    def shutdown(self):
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+
+jobs = JobManager()
+_estimator = None
+
+
+def estimator():
+    global _estimator
+    if _estimator is None:
+        _estimator = Basuras()
+    return _estimator
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Carga el modelo una sola vez al iniciar: todos los trabajos lo comparten
+    await asyncio.to_thread(VisionYolo.warmup)
+    yield
+    jobs.shutdown()
+
+
+app = FastAPI(title="Evaluación de limpieza de calles de Medellín", lifespan=lifespan)
+
+
+def get_job(job_id):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    return job
+
+
+def validate_request(request):
+    if request.streets and request.adaptive:
+        raise HTTPException(status_code=422, detail="El muestreo adaptativo no se puede combinar con streets")
+    if request.streets and not RedVial.disponible():
+        raise HTTPException(status_code=422, detail="No hay un extracto de OpenStreetMap configurado (OSM_EXTRACT)")
+
+
+@app.post("/jobs", status_code=202)
+def create_job(request: JobRequest):
+    validate_request(request)
+    job = jobs.submit(request)
+    if job is None:
+        raise HTTPException(status_code=429, detail="La cola de trabajos está llena, intente más tarde")
+    return job.to_dict()
+
+
+@app.post("/estimate")
+def estimate(request: JobRequest):
+    """Estimación previa de llamadas, tokens, bytes y costo, sin encolar el trabajo."""
+    validate_request(request)
+    return estimator().estimar_costo(request.latitud, request.longitud, request.distancia, request.step,
+                                     request.circular, budget=request.budget, streets=request.streets)
+
+
+@app.get("/jobs")
+def list_jobs():
+    return [job.to_dict() for job in jobs.list()]
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    return get_job(job_id).to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, interval: float = 1.0):
+    job = get_job(job_id)
+
+    async def events():
+        last = None
+        while True:
+            state = job.to_dict()
+            if state != last:
+                yield f"data: {json.dumps(state, ensure_ascii=False)}\n\n"
+                last = state
+            if job.terminal:
+                break
+            await asyncio.sleep(max(interval, 0.2))
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/jobs/{job_id}/results")
+def job_results(job_id: str, format: str = "json"):
+    job = get_job(job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado {job.status}")
+    df = job.df.copy()
+    df["ImageUrl"] = [f"/jobs/{job.id}/images/{image_name(path)}" if path and path != "ERROR" else None
+                      for path in df["Image"].fillna("")]
+    if format == "csv":
+        return Response(df.to_csv(index=False), media_type="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{job.id}.csv"'})
+    return Response(df.to_json(orient="records", force_ascii=False), media_type="application/json")
+
+
+@app.get("/jobs/{job_id}/streets")
+def job_streets(job_id: str, format: str = "json"):
+    job = get_job(job_id)
+    if job.status != "completed":
+        raise HTTPException(status_code=409, detail=f"El trabajo está en estado {job.status}")
+    if job.df_streets is None:
+        raise HTTPException(status_code=404, detail="El trabajo no se ejecutó con muestreo sobre calles")
+    if format == "csv":
+        return Response(job.df_streets.to_csv(index=False), media_type="text/csv",
+                        headers={"Content-Disposition": f'attachment; filename="{job.id}_calles.csv"'})
+    return Response(job.df_streets.to_json(orient="records", force_ascii=False), media_type="application/json")
+
+
+@app.get("/jobs/{job_id}/images/{name}")
+def job_image(job_id: str, name: str, thumbnail: bool = False):
+    job = get_job(job_id)
+    # Solo se sirven imágenes de las filas del trabajo o, mientras sigue en curso, de su carpeta
+    if name != os.path.basename(name) or (job.results_folder is None and name not in job.images):
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    if name in job.images:
+        content = read_image(job.images[name], thumbnail=thumbnail)
+    elif job.status == "completed":
+        content = None
+    elif name.endswith(".jpg") or not PanoramaArchive.exists(job.results_folder):
+        content = read_image(os.path.join(job.results_folder, name))
+    else:
+        content = read_image(archive_ref(job.results_folder, name), thumbnail=thumbnail)
+    if content is None:
+        raise HTTPException(status_code=404, detail="Imagen no encontrada")
+    return Response(content, media_type=image_mime(content), headers={"Cache-Control": "max-age=86400"})
+
+
+@app.delete("/jobs/{job_id}")
+def cancel_job(job_id: str):
+    get_job(job_id)
+    if not jobs.cancel(job_id):
+        raise HTTPException(status_code=409, detail="Solo se pueden cancelar trabajos en cola")
+    return {"id": job_id, "status": "cancelled"}
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(app, host=os.getenv("API_HOST", "127.0.0.1"), port=int(os.getenv("API_PORT", "8000")))
@@ -6,9 +6,122 @@ import folium
 from geopy.distance import geodesic
 from st_aggrid import AgGrid, GridOptionsBuilder
 from vision_helper import Basuras
-import ast
+from geo_helper import CENTRO_MEDELLIN, RADIO_SERVICIO_KM
+from iplu_helper import agregar_iplu, clasificar_iplu, NIVELES_PRIORIDAD
+from results_helper import construir_resultados
+from storage_helper import read_image
+from osm_helper import RedVial
+from folium.plugins import FastMarkerCluster, HeatMap
+import time
+
 
 st.set_page_config(layout="wide")
+
+nuevos_nombres = {
+    'Latitude': 'Latitud',
+    'Longitude': 'Longitud',
+    'es_imagen_valida': 'Imagen Válida',
+    'limpieza_general': 'Limpieza General',
+    'acumulacion_basura': 'Acumulación de Basura',
+    'intensidad_basura': 'Intensidad de Basura',
+    'recoleccion_urgente': 'Recolección Urgente',
+    'papeleras_presentes': 'Papeleras Presentes',
+    'justificacion': 'Justificación',
+    'IPLU': 'IPLU',
+    'Prioridad': 'Prioridad',
+    'Image': 'Imagen',
+    'Label': 'Clasificación (YOLO)',
+    'PanoId': 'ID Panorámica'
+}
+
+
+@st.cache_resource
+def estimador():
+    """Instancia de `Basuras` usada solo para las estimaciones previas (comparte almacén y cupo)."""
+    return Basuras()
+
+
+@st.cache_resource
+def mapa_base():
+    """Mapa del área de servicio; se construye una sola vez por proceso."""
+    m = folium.Map(location=list(CENTRO_MEDELLIN), zoom_start=12)
+    folium.Circle(
+        location=list(CENTRO_MEDELLIN),
+        radius=RADIO_SERVICIO_KM * 1000,
+        color='purple',
+        fill=True,
+        fill_opacity=0.05
+    ).add_to(m)
+    m.add_child(folium.LatLngPopup())
+    return m
+
+
+# Las funciones siguientes reciben el DataFrame sin hashearlo (`_df`): la llave de la caché es el id de la ejecución,
+# que incluye una versión del resultado (una ejecución reanudada reutiliza la misma carpeta)
+@st.cache_data(max_entries=8)
+def tablas_resultados(run_id, _df):
+    """DataFrame renombrado y tablas de resumen de una ejecución."""
+    df = _df.rename(columns=nuevos_nombres)
+    resumenes = {}
+    for columna in ['Papeleras Presentes', 'Acumulación de Basura', 'Clasificación (YOLO)']:
+        conteo = df[columna].value_counts().sort_index()
+        resumenes[columna] = pd.DataFrame({
+            'Cantidad': conteo,
+            'Porcentaje (%)': ((conteo / conteo.sum()) * 100).round(1)
+        }).reset_index().rename(columns={'index': 'Categoría'})
+    return df, resumenes
+
+
+@st.cache_resource(max_entries=8)
+def mapa_resultados(run_id, _df):
+    """Mapa de resultados con marcadores agrupados (coloreados por prioridad) y una capa de calor del IPLU."""
+    validos = _df.dropna(subset=['IPLU'])
+    centro = [validos['Latitude'].mean(), validos['Longitude'].mean()] if len(validos) else list(CENTRO_MEDELLIN)
+    m = folium.Map(location=centro, zoom_start=15)
+
+    maximo = max(float(validos['IPLU'].max()), 1.0) if len(validos) else 1.0
+    HeatMap(
+        (validos[['Latitude', 'Longitude']].assign(peso=validos['IPLU'] / maximo)).to_numpy().tolist(),
+        name='Mapa de calor IPLU', radius=18, min_opacity=0.3
+    ).add_to(m)
+
+    # FastMarkerCluster crea los marcadores en el navegador, por lo que escala a miles de puntos
+    colores = {nivel: color for _, nivel, _, color in NIVELES_PRIORIDAD}
+    puntos = pd.DataFrame({
+        'lat': validos['Latitude'],
+        'lon': validos['Longitude'],
+        'iplu': validos['IPLU'].round(1),
+        'color': validos['Prioridad'].map(colores).astype(object).fillna('#9E9E9E'),
+    })
+    callback = """
+    function (row) {
+        var marker = L.circleMarker(new L.LatLng(row[0], row[1]), {radius: 6, color: row[3], fillOpacity: 0.8});
+        marker.bindPopup("IPLU: " + row[2]);
+        return marker;
+    }
+    """
+    FastMarkerCluster(puntos.to_numpy().tolist(), callback=callback, name='Puntos analizados').add_to(m)
+    folium.LayerControl().add_to(m)
+    return m
+
+
+@st.cache_data(max_entries=8)
+def opciones_grilla(run_id, _df):
+    gb = GridOptionsBuilder.from_dataframe(_df)
+    gb.configure_selection('single', use_checkbox=True)
+    return gb.build()
+
+
+@st.cache_data(max_entries=256)
+def cargar_imagen(ruta, miniatura=False):
+    """Bytes de la panorámica (o su miniatura) a partir del valor de la columna Imagen."""
+    return read_image(ruta, thumbnail=miniatura)
+
+
+@st.cache_data(max_entries=4)
+def exportar_csv(run_id, _df):
+    return _df.to_csv(index=False).encode('utf-8')
+
 st.sidebar.image("logo.png", use_container_width=True)
 
 # HTML para fijar nombres al fondo del sidebar, centrados
@@ -37,22 +150,14 @@ st.markdown("<h1 style='text-align: center;'>Evaluación de la Limpieza Urbana e
 st.markdown("A continuación realizarás un análisis de una zona específica en **Medellín**. Para ello, selecciona en el mapa el **punto central** de la zona que deseas analizar. Luego, en la parte lateral, indica la **distancia** (radio del área a analizar) y el **step** (espaciado entre puntos dentro del área). Recuerda que **solo se permiten puntos dentro del área delimitada en el mapa**. Si conoces las coordenadas exactas del lugar que deseas analizar, también puedes ingresarlas manualmente.")
 
 # Centro de Medellín
-centro_medellin = [6.2442, -75.5812]
-radio_km = 8
+centro_medellin = list(CENTRO_MEDELLIN)
+radio_km = RADIO_SERVICIO_KM
 
 col1, col2 = st.columns([2, 1])  # Más espacio al mapa
+en_vivo = st.container()  # Resultados parciales mientras se procesa la zona
 
 with col1:
-    m = folium.Map(location=centro_medellin, zoom_start=12)
-    folium.Circle(
-        location=centro_medellin,
-        radius=radio_km * 1000,
-        color='purple',
-        fill=True,
-        fill_opacity=0.05
-    ).add_to(m)
-    m.add_child(folium.LatLngPopup())
-    map_data = st_folium(m, width=700, height=500)
+    map_data = st_folium(mapa_base(), width=700, height=500, returned_objects=["last_clicked"])
 
 # Inicializar valores por defecto
 auto_lat, auto_lon = None, None
@@ -70,48 +175,91 @@ with col2:
             st.error(f"El punto seleccionado está fuera del área permitida ({distancia_seleccion:.2f} km del centro). Selecciona un punto dentro de la zona delimitada")
     if 'df' not in st.session_state:
         st.session_state.df = pd.DataFrame()
+        st.session_state.df_calles = None
+        st.session_state.run_id = None
 
     with st.form(key='parametros_form'):
         latitud = st.number_input("Latitud", format="%.6f", value=auto_lat if auto_lat else 0.0)
         longitud = st.number_input("Longitud", format="%.6f", value=auto_lon if auto_lon else 0.0)
         distancia = st.number_input("Distancia (metros)", min_value=100, step=1)
         step = st.number_input("Paso (metros)", min_value=10, step=1)
+        circular = st.checkbox("Usar la distancia como radio (área circular)", value=False)
+        reanudar = st.checkbox("Reanudar la última ejecución con estos parámetros", value=True)
+        adaptativo = st.checkbox("Muestreo adaptativo (el paso es el mínimo; solo se refinan las zonas sucias)", value=False)
+        calles = st.checkbox("Muestrear sobre las calles (extracto de OpenStreetMap)", value=False,
+                             disabled=not RedVial.disponible(),
+                             help="Requiere OSM_EXTRACT con un extracto .osm o GeoJSON de la red vial")
+        presupuesto = st.number_input("Máximo de puntos nuevos (0 = sin límite)", min_value=0, step=100, value=0)
+        estimar_button = st.form_submit_button(label='Estimar costo')
         submit_button = st.form_submit_button(label='Realizar análisis')
 
+    if (estimar_button or submit_button) and calles and adaptativo:
+        st.error("El muestreo adaptativo no se puede combinar con el muestreo sobre calles.")
+        estimar_button = submit_button = False
+
+    if estimar_button and all([latitud, longitud, distancia, step]):
+        estimacion = estimador().estimar_costo(latitud, longitud, distancia, step, circular, budget=presupuesto or None,
+                                               streets=calles)
+        st.markdown("**Estimación previa" + (" (máximo, muestreo adaptativo)" if adaptativo else "") + "**")
+        col_a, col_b = st.columns(2)
+        col_a.metric("Puntos nuevos", f"{estimacion['pendientes']:,}")
+        col_b.metric("Costo estimado (USD)", f"{estimacion['costo_total_usd']:,.2f}")
+        st.table(pd.DataFrame({
+            'Concepto': ['Puntos sobre calles' if calles else 'Puntos en la malla', 'Reutilizados de ejecuciones anteriores', 'Omitidos por presupuesto',
+                         'Consultas de metadatos (sin costo)', 'Imágenes de Street View (máx.)', 'Llamadas a Gemini (máx.)',
+                         'Tokens de entrada', 'Tokens de salida', 'Descarga (MB)'],
+            'Valor': [estimacion['puntos'], estimacion['reutilizados'], estimacion['omitidos_presupuesto'],
+                      estimacion['llamadas_metadatos'], estimacion['llamadas_street_view'], estimacion['llamadas_gemini'],
+                      estimacion['tokens_entrada'], estimacion['tokens_salida'], round(estimacion['bytes_descarga'] / 1e6, 1)],
+        }).astype({'Valor': str}))
+        if estimacion['cupo_diario_disponible'] is not None:
+            st.caption(f"Cupo diario disponible: {estimacion['cupo_diario_disponible']:,} puntos")
+
     if submit_button:
         if all([latitud, longitud, distancia, step]):
-            with st.spinner("Generando puntos, capturando imágenes, realizando análisis..."):
-                latitud_str = str(latitud).replace(",",".")
-                longitud_str = str(longitud).replace(",",".")
-                st.session_state.df = Basuras().buscar_basuras_en_zona(latitud_str, longitud_str, distancia, step)
-                
-                st.success("Análisis completado con éxito.")
+            latitud_str = str(latitud).replace(",",".")
+            longitud_str = str(longitud).replace(",",".")
+            basuras = Basuras()
+
+            with en_vivo:
+                progreso = st.progress(0.0, text="Generando puntos y agrupando panorámicas...")
+                col_iplu, col_mapa, col_grafico = st.columns([1, 2, 2])
+                iplu_en_vivo = col_iplu.empty()
+                mapa_en_vivo = col_mapa.empty()
+                grafico_en_vivo = col_grafico.empty()
+
+            filas = []
+            ultimo_refresco = 0.0
+            for fila in basuras.iterar_basuras_en_zona(latitud_str, longitud_str, distancia, step, circular, reanudar,
+                                                         adaptive=adaptativo, budget=presupuesto or None, streets=calles):
+                filas.append(fila)
+
+                hechos, total = basuras.progress["done"], basuras.progress["total"]
+                # Refrescar como máximo dos veces por segundo para no saturar el navegador
+                if time.monotonic() - ultimo_refresco < 0.5 and hechos < total:
+                    continue
+                ultimo_refresco = time.monotonic()
+                progreso.progress(hechos / total if total else 1.0, text=f"Puntos analizados: {hechos} de {total}")
+                parcial = agregar_iplu(construir_resultados(filas))
+                if parcial['IPLU'].notna().any():
+                    iplu_en_vivo.metric("IPLU parcial", round(parcial['IPLU'].mean(), 2))
+                mapa_en_vivo.map(parcial, latitude='Latitude', longitude='Longitude', size=10)
+                grafico_en_vivo.bar_chart(parcial['limpieza_general'].value_counts().sort_index())
+
+            progreso.progress(1.0, text="Análisis completado")
+            st.session_state.df = agregar_iplu(basuras.df)
+            st.session_state.df_calles = basuras.df_streets
+            # Al reanudar, la carpeta se repite entre ejecuciones: la versión distingue cada resultado
+            st.session_state.run_id = f"{basuras.results_folder}@{len(basuras.df)}@{time.time_ns()}"
+            st.success("Análisis completado con éxito.")
         else:
             st.error("Por favor, complete todos los campos correctamente.")
 
 # Procesamiento del DataFrame
 if not st.session_state.df.empty:
-    df = st.session_state.df
-
-    df['Description'] = df['Description'].apply(lambda x: ast.literal_eval(x) if isinstance(x, str) else x)
-    desc_df = pd.json_normalize(df['Description'])
-    df = pd.concat([df.drop(columns=['Description']), desc_df], axis=1)
-
-    def calcular_iplu(fila):
-        intensidad_puntos = {'No': 0, 'leve': 1, 'moderada': 2, 'alta': 3}
-        urgencia_puntos = {'No urgente': 0, 'Moderadamente urgente': 2, 'Urgente': 4}
-        acumulacion_basura = {'Sí': 2, 'No': 0}
-
-        nsv_1 = abs(fila['limpieza_general'] - 10)
-        nsv = nsv_1 * 2 if nsv_1 <= 6 else nsv_1 * 0.5
-        aeb = intensidad_puntos.get(fila['intensidad_basura'], 0)
-        acb = acumulacion_basura.get(fila['acumulacion_basura'], 0)
-        ur = urgencia_puntos.get(fila['recoleccion_urgente'], 0)
-        pcv = 0 if fila['papeleras_presentes'] == 'Sí' else 2
-
-        return nsv + aeb + ur + pcv + acb
-
-    df['IPLU'] = df.apply(calcular_iplu, axis=1)
+    # Las evaluaciones llegan ya aplanadas y tipadas, con IPLU y prioridad calculados una sola vez
+    run_id = st.session_state.run_id
+    df, resumenes = tablas_resultados(run_id, st.session_state.df)
 
     st.markdown("<hr>", unsafe_allow_html=True)
     st.markdown("<h2 style='text-align: center;'>Análisis Exploratorio: Evaluación del IPLU y Variables Clave</h2>", unsafe_allow_html=True)
@@ -133,22 +281,6 @@ if not st.session_state.df.empty:
     
     col1, col2, col3 = st.columns(3)
 
-    nuevos_nombres = {
-        'Latitude': 'Latitud',
-        'Longitude': 'Longitud',
-        'es_imagen_valida': 'Imagen Válida',
-        'limpieza_general': 'Limpieza General',
-        'acumulacion_basura': 'Acumulación de Basura',
-        'intensidad_basura': 'Intensidad de Basura',
-        'recoleccion_urgente': 'Recolección Urgente',
-        'papeleras_presentes': 'Papeleras Presentes',
-        'justificacion': 'Justificación',
-        'IPLU': 'IPLU',
-        'Image': 'Imagen',
-        'Label': 'Clasificación (YOLO)'
-    }
-    df = df.rename(columns=nuevos_nombres)
-
     with col1:
         st.markdown("<h4 style='text-align: center;'>Limpieza General</h4>", unsafe_allow_html=True)
         st.bar_chart(df['Limpieza General'].value_counts().sort_index())
@@ -161,63 +293,21 @@ if not st.session_state.df.empty:
 
     col4, col5, col6 = st.columns(3)
     with col4:
-        conteo = df['Papeleras Presentes'].value_counts().sort_index()
-        porcentaje = (conteo / conteo.sum()) * 100
-
-        tabla_resumen = pd.DataFrame({
-            'Cantidad': conteo,
-            'Porcentaje (%)': porcentaje.round(1)
-        }).reset_index().rename(columns={'index': 'Categoría'})
-
-        # Mostrar la tabla
         st.markdown("<h4 style='text-align: center;'>Presencia de Contenedores de Basura</h4>", unsafe_allow_html=True)
-        st.table(tabla_resumen)
+        st.table(resumenes['Papeleras Presentes'])
 
     with col5:
-        conteo = df['Acumulación de Basura'].value_counts().sort_index()
-        porcentaje = (conteo / conteo.sum()) * 100
-
-        tabla_resumen = pd.DataFrame({
-            'Cantidad': conteo,
-            'Porcentaje (%)': porcentaje.round(1)
-        }).reset_index().rename(columns={'index': 'Categoría'})
-
-        # Mostrar la tabla
         st.markdown("<h4 style='text-align: center;'>Acumulación de Basura</h4>", unsafe_allow_html=True)
-        st.table(tabla_resumen)
+        st.table(resumenes['Acumulación de Basura'])
     
     with col6:
-        conteo = df['Clasificación (YOLO)'].value_counts().sort_index()
-        porcentaje = (conteo / conteo.sum()) * 100
-
-        tabla_resumen = pd.DataFrame({
-            'Cantidad': conteo,
-            'Porcentaje (%)': porcentaje.round(1)
-        }).reset_index().rename(columns={'index': 'Categoría'})
-
-        # Mostrar la tabla
         st.markdown("<h4 style='text-align: center;'>Clasificación (YOLO)</h4>", unsafe_allow_html=True)
-        st.table(tabla_resumen)
+        st.table(resumenes['Clasificación (YOLO)'])
     
     st.markdown("<h3 style='text-align: center;'>Índice de Priorización de Limpieza Urbana (IPLU)</h3>", unsafe_allow_html=True)
     # Clasificación según el valor
     iplu_valor = round(df['IPLU'].mean(), 2)
-    if iplu_valor <= 5:
-        nivel = "Baja Prioridad"
-        descripcion = "Zona limpia. Se recomienda monitoreo regular."
-        color = "#4CAF50"  # verde
-    elif iplu_valor <= 10:
-        nivel = "Media Prioridad"
-        descripcion = "Zona con cierta acumulación de residuos. Se requiere seguimiento frecuente."
-        color = "#FFC107"  # amarillo
-    elif iplu_valor <= 15:
-        nivel = "Alta Prioridad"
-        descripcion = "Zona con acumulación significativa de basura. Atención urgente necesaria."
-        color = "#FF5722"  # naranja
-    else:
-        nivel = "Crítica"
-        descripcion = "Zona en condiciones críticas de limpieza. Se requiere intervención inmediata."
-        color = "#F44336"  # rojo
+    nivel, descripcion, color = clasificar_iplu(iplu_valor)
 
     # === Sección organizada en columnas ===
     col1, col2, = st.columns([1, 5])
@@ -253,32 +343,44 @@ if not st.session_state.df.empty:
 
     columnas_a_mostrar = list(nuevos_nombres.values())
 
+    if st.session_state.get('df_calles') is not None and not st.session_state.df_calles.empty:
+        st.markdown("<h3 style='text-align: center;'>Tramos de Calle con Mayor IPLU</h3>", unsafe_allow_html=True)
+        st.dataframe(st.session_state.df_calles[['Nombre', 'Tipo', 'Longitud', 'Puntos', 'IPLU', 'IPLU_max', 'Prioridad']],
+                     hide_index=True, use_container_width=True, height=300)
+
+    st.markdown("<hr>", unsafe_allow_html=True)
+    st.markdown("<h3 style='text-align: center;'>Mapa de Resultados</h3>", unsafe_allow_html=True)
+    st_folium(mapa_resultados(run_id, st.session_state.df), height=500, use_container_width=True,
+              returned_objects=[], key=f"mapa_{run_id}")
+
     st.markdown("<hr>", unsafe_allow_html=True)
 
     col5, col4 = st.columns([4, 1])
     with col5:
         st.markdown("<h3 style='text-align: center;'>Detalle de Información Empleada para el Análisis</h3>", unsafe_allow_html=True)
     with col4:
-        csv = df.to_csv(index=False).encode('utf-8')
-
-        # Botón de descarga
-        st.download_button(
-            label="📥 Descargar CSV",
-            data=csv,
-            file_name='datos.csv',
-            mime='text/csv'
-        )
+        # El CSV solo se genera cuando se pide, y una sola vez por ejecución
+        if st.session_state.get('csv_run_id') != run_id:
+            if st.button("Preparar CSV"):
+                st.session_state.csv_run_id = run_id
+                st.rerun()
+        else:
+            st.download_button(
+                label="📥 Descargar CSV",
+                data=exportar_csv(run_id, df),
+                file_name='datos.csv',
+                mime='text/csv'
+            )
 
-    gb = GridOptionsBuilder.from_dataframe(df)
-    gb.configure_selection('single', use_checkbox=True)
-    grid_options = gb.build()
+    grid_options = opciones_grilla(run_id, df)
 
     grid_response = AgGrid(
         df, 
         gridOptions=grid_options, 
         height=300, 
         width='100%', 
-        reload_data=True
+        reload_data=False,
+        key=f"grid_{run_id}"
     )
 
     # Obtener la selección
@@ -302,10 +404,14 @@ if not st.session_state.df.empty:
     # Si se obtuvo una fila, extraer la ruta y mostrar la imagen
     if fila is not None:
         ruta = fila.get('Imagen', None)
-        if ruta:
-            # Eliminar el prefijo './' (puedes usar removeprefix en Python 3.9+)
-            ruta_relativa = ruta.lstrip("./")
-            st.image(ruta_relativa, caption=f"Coordenadas: {fila.get('Latitud', None)}, {fila.get('Longitud', None)}", use_container_width=False)
+        miniatura = cargar_imagen(ruta, miniatura=True) if ruta and ruta != "ERROR" else None
+        if miniatura:
+            # Primero la miniatura; la panorámica completa solo se carga si se pide
+            caption = f"Coordenadas: {fila.get('Latitud', None)}, {fila.get('Longitud', None)}"
+            if st.toggle("Ver imagen completa", key=f"completa_{ruta}"):
+                st.image(cargar_imagen(ruta), caption=caption, use_container_width=True)
+            else:
+                st.image(miniatura, caption=caption, use_container_width=False)
             st.write(f"{fila.get('Justificación')}")
             
         else:
@@ -0,0 +1,307 @@
+"""Benchmark fuera de línea de `Basuras.buscar_basuras_en_zona`.
+
+Levanta servidores HTTP locales que imitan Street View (imágenes y metadatos) y Gemini `generateContent`,
+con latencia, tasa de errores y respuestas 429 configurables, y sustituye YOLO por un stub de costo fijo.
+Cada tamaño de malla se ejecuta en un proceso aparte (memoria pico independiente) y el resultado se guarda
+en JSON para comparar entre commits:
+
+    python benchmark.py --sizes 200,400,800 --step 20 --output bench.json
+    python benchmark.py --sizes 200,400,800 --step 20 --compare bench.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import queue
+import random
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from urllib.parse import urlparse, parse_qs
+
+from PIL import Image, ImageDraw
+
+from geo_helper import CENTRO_MEDELLIN
+
+METERS_PER_DEGREE = 111_320
+
+
+class FakeConfig():
+    def __init__(self, latency_ms=80, gemini_latency_ms=1200, error_rate=0.0, rate_429=0.0,
+                 no_coverage_rate=0.05, pano_spacing=15):
+        self.latency_ms = latency_ms
+        self.gemini_latency_ms = gemini_latency_ms
+        self.error_rate = error_rate
+        self.rate_429 = rate_429
+        self.no_coverage_rate = no_coverage_rate
+        self.pano_spacing = pano_spacing
+
+
+class FakeGoogleServer():
+    """Servidor local con los endpoints de Street View Static, sus metadatos y Gemini."""
+
+    def __init__(self, config):
+        self.config = config
+        self.counters = {}
+        self.__lock = threading.Lock()
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__handler())
+        self.__server.daemon_threads = True
+        self.__thread = threading.Thread(target=self.__server.serve_forever, daemon=True)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.__server.server_address[1]}"
+
+    def start(self):
+        self.__thread.start()
+        return self
+
+    def stop(self):
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def count(self, name):
+        with self.__lock:
+            self.counters[name] = self.counters.get(name, 0) + 1
+
+    def reset(self):
+        with self.__lock:
+            counters, self.counters = self.counters, {}
+        return counters
+
+    def __handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def __send(self, status, body, content_type):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def __inject_failure(self, name, latency_ms):
+                time.sleep(max(0.0, random.gauss(latency_ms, latency_ms * 0.2)) / 1000)
+                roll = random.random()
+                if roll < fake.config.rate_429:
+                    fake.count(f"{name}_429")
+                    self.__send(429, b'{"error": "RESOURCE_EXHAUSTED"}', "application/json")
+                    return True
+                if roll < fake.config.rate_429 + fake.config.error_rate:
+                    fake.count(f"{name}_500")
+                    self.__send(500, b'{"error": "INTERNAL"}', "application/json")
+                    return True
+                return False
+
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                query = {key: values[0] for key, values in parse_qs(parsed.query).items()}
+                if parsed.path.endswith("/metadata"):
+                    fake.count("metadata")
+                    time.sleep(fake.config.latency_ms / 4000)
+                    self.__send(200, json.dumps(fake.metadata(query.get("location", "0,0"))).encode(), "application/json")
+                elif parsed.path.endswith("/streetview"):
+                    fake.count("streetview")
+                    if self.__inject_failure("streetview", fake.config.latency_ms):
+                        return
+                    seed = f"{query.get('pano') or query.get('location')}|{query.get('heading')}"
+                    self.__send(200, fake.image(seed), "image/jpeg")
+                else:
+                    self.__send(404, b"", "text/plain")
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                if not self.path.split("?")[0].endswith(":generateContent"):
+                    self.__send(404, b"", "text/plain")
+                    return
+                fake.count("gemini")
+                if self.__inject_failure("gemini", fake.config.gemini_latency_ms):
+                    return
+                self.__send(200, json.dumps(fake.gemini_response(json.loads(body or b"{}"))).encode(), "application/json")
+
+        return Handler
+
+    def metadata(self, location):
+        lat, lng = (float(value) for value in location.split(","))
+        digest = int(hashlib.sha1(location.encode()).hexdigest(), 16)
+        if digest % 10_000 < self.config.no_coverage_rate * 10_000:
+            return {"status": "ZERO_RESULTS"}
+        spacing = self.config.pano_spacing / METERS_PER_DEGREE
+        snap_lat, snap_lng = round(lat / spacing) * spacing, round(lng / spacing) * spacing
+        return {"status": "OK", "pano_id": f"fake_{snap_lat:.6f}_{snap_lng:.6f}",
+                "location": {"lat": snap_lat, "lng": snap_lng}}
+
+    def image(self, seed):
+        digest = hashlib.sha1(seed.encode()).digest()
+        img = Image.new("RGB", (600, 300), tuple(digest[:3]))
+        ImageDraw.Draw(img).rectangle([digest[3], digest[4], 300 + digest[5], 150 + digest[6] // 2], fill=tuple(digest[7:10]))
+        buffer = BytesIO()
+        img.save(buffer, format="JPEG", quality=75)
+        return buffer.getvalue()
+
+    def gemini_response(self, request):
+        parts = [part for content in request.get("contents", []) for part in content.get("parts", [])]
+        images = sum(1 for part in parts if "inlineData" in part or "inline_data" in part)
+        assessments = [self.assessment(n) for n in range(1, max(images, 1) + 1)]
+        text = json.dumps(assessments if images > 1 else assessments[0], ensure_ascii=False)
+        return {"candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP", "index": 0}],
+                "usageMetadata": {"promptTokenCount": 600 + 260 * images, "candidatesTokenCount": 120 * max(images, 1)}}
+
+    def assessment(self, index):
+        limpieza = random.randint(1, 10)
+        acumulacion = "Sí" if limpieza < 6 else "No"
+        return {
+            "indice": index,
+            "es_imagen_valida": True,
+            "limpieza_general": limpieza,
+            "acumulacion_basura": acumulacion,
+            "intensidad_basura": random.choice(["Leve", "Moderada", "Alta"]) if acumulacion == "Sí" else "No Aplica",
+            "recoleccion_urgente": random.choice(["No urgente", "Moderadamente Urgente", "Urgente"]),
+            "papeleras_presentes": random.choice(["Sí", "No"]),
+            "justificacion": "Evaluación simulada para benchmark.",
+        }
+
+
+class StubYolo():
+    """Sustituto de YOLO con un costo de CPU fijo por imagen."""
+    names = {0: "limpia", 1: "sucia"}
+
+    def __init__(self, ms_per_image=15, ms_per_batch=20):
+        self.ms_per_image = ms_per_image
+        self.ms_per_batch = ms_per_batch
+
+    def __call__(self, images, verbose=False):
+        images = images if isinstance(images, list) else [images]
+        end = time.perf_counter() + (self.ms_per_batch + self.ms_per_image * len(images)) / 1000
+        while time.perf_counter() < end:
+            pass
+        results = []
+        for img in images:
+            # Resumen estable entre procesos (hash() cambia con cada proceso lanzado con spawn)
+            top1 = hashlib.sha1(img.tobytes()[:64]).digest()[0] % 2
+            probs = types.SimpleNamespace(top1=top1, top1conf=0.9, data=[0.9, 0.1] if top1 == 0 else [0.1, 0.9])
+            results.append(types.SimpleNamespace(names=self.names, probs=probs))
+        return results
+
+
+def run_scenario(env, distancia, step, yolo_ms, results):
+    """Ejecuta una zona en un proceso nuevo: la configuración de las clases se lee del entorno al importar."""
+    os.environ.update(env)
+    os.chdir(tempfile.mkdtemp(prefix="bench_run_"))
+    import vision_helper
+
+    vision_helper.VisionYolo.set_model(StubYolo(ms_per_image=yolo_ms))
+    basuras = vision_helper.Basuras()
+    start = time.perf_counter()
+    df = basuras.buscar_basuras_en_zona(f"{CENTRO_MEDELLIN[0]}", f"{CENTRO_MEDELLIN[1]}", distancia, step)
+    seconds = time.perf_counter() - start
+    results.put({
+        "distancia": distancia,
+        "step": step,
+        "points": int(basuras.progress["total"]),
+        "rows": int(len(df)),
+        "seconds": round(seconds, 3),
+        "points_per_sec": round(len(df) / seconds, 2) if seconds else None,
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "stages": basuras.stage_stats,
+    })
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(previous_path, report):
+    with open(previous_path, encoding="utf-8") as f:
+        previous = {scenario["distancia"]: scenario for scenario in json.load(f)["scenarios"]}
+    print(f"\nComparación con {previous_path}:")
+    for scenario in report["scenarios"]:
+        before = previous.get(scenario["distancia"])
+        if not before or not before.get("points_per_sec"):
+            continue
+        change = 100 * (scenario["points_per_sec"] / before["points_per_sec"] - 1)
+        print(f"  distancia={scenario['distancia']}: {before['points_per_sec']} -> {scenario['points_per_sec']} puntos/s ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="200,400,800", help="valores de `distancia` separados por coma (metros)")
+    parser.add_argument("--step", type=float, default=20)
+    parser.add_argument("--latency-ms", type=float, default=80, help="latencia media de Street View")
+    parser.add_argument("--gemini-latency-ms", type=float, default=1200)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fracción de respuestas 500")
+    parser.add_argument("--rate-429", type=float, default=0.0, help="fracción de respuestas 429")
+    parser.add_argument("--no-coverage-rate", type=float, default=0.05)
+    parser.add_argument("--pano-spacing", type=float, default=15, help="separación entre panorámicas falsas (metros)")
+    parser.add_argument("--yolo-ms", type=float, default=15, help="costo de CPU del stub de YOLO por imagen")
+    parser.add_argument("--env", action="append", default=[], help="variable de entorno extra KEY=VALUE (p. ej. GEMINI_RPS=50)")
+    parser.add_argument("--output", default=None)
+    parser.add_argument("--compare", default=None, help="JSON de una ejecución anterior para comparar")
+    args = parser.parse_args()
+
+    config = FakeConfig(args.latency_ms, args.gemini_latency_ms, args.error_rate, args.rate_429,
+                        args.no_coverage_rate, args.pano_spacing)
+    server = FakeGoogleServer(config).start()
+    cache_dir = tempfile.mkdtemp(prefix="bench_cache_")
+    env = {
+        "API_KEY_STREET_VIEW": "bench",
+        "API_KEY_VISION_GOOGLE": "bench",
+        "STREET_VIEW_BASE_URL": f"{server.url}/streetview",
+        "GEMINI_BASE_URL": server.url,
+        "STREET_VIEW_CACHE_DIR": os.path.join(cache_dir, "street_view"),
+        "GEMINI_CACHE_DIR": os.path.join(cache_dir, "gemini"),
+        # Cascada apagada por defecto para que las llamadas a Gemini sean comparables entre ejecuciones
+        "CASCADE_CONFIDENCE": "1.1",
+    }
+    env.update(dict(item.split("=", 1) for item in args.env))
+
+    context = multiprocessing.get_context("spawn")
+    report = {"commit": git_commit(), "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+              "config": {**vars(args), "env": env}, "scenarios": []}
+    try:
+        for distancia in (float(size) for size in args.sizes.split(",")):
+            # Cada escenario parte de cachés vacías para medir el costo real
+            scenario_env = dict(env, STREET_VIEW_CACHE_DIR=tempfile.mkdtemp(dir=cache_dir),
+                                GEMINI_CACHE_DIR=tempfile.mkdtemp(dir=cache_dir))
+            results = context.Queue()
+            process = context.Process(target=run_scenario, args=(scenario_env, distancia, args.step, args.yolo_ms, results))
+            process.start()
+            scenario = None
+            while scenario is None:
+                try:
+                    scenario = results.get(timeout=1)
+                except queue.Empty:
+                    if not process.is_alive():
+                        raise RuntimeError(f"El escenario distancia={distancia} terminó sin resultados (código {process.exitcode})")
+            process.join()
+            scenario["api_calls"] = server.reset()
+            report["scenarios"].append(scenario)
+            print(f"distancia={distancia:.0f} m: {scenario['rows']} filas en {scenario['seconds']} s "
+                  f"({scenario['points_per_sec']} puntos/s, {scenario['peak_rss_mb']} MB) llamadas={scenario['api_calls']}")
+    finally:
+        server.stop()
+
+    output = args.output or f"bench_{report['commit'] or 'local'}.json"
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Resultados guardados en {output}")
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,206 @@
+import os
+import sqlite3
+import threading
+import time
+import hashlib
+import json
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class ImageCache():
+    """Caché persistente en disco para las imágenes de Street View, con límite de tamaño (LRU) y TTL opcional."""
+    __CACHE_DIR = os.getenv("STREET_VIEW_CACHE_DIR", "./.cache/street_view")
+    __MAX_BYTES = int(os.getenv("STREET_VIEW_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+    __TTL = os.getenv("STREET_VIEW_CACHE_TTL")  # segundos, vacío = sin expiración
+    __DECIMALS = int(os.getenv("STREET_VIEW_CACHE_DECIMALS", "5"))
+
+    def __init__(self, cache_dir=None, max_bytes=None, ttl=None, decimals=None):
+        self.cache_dir = cache_dir or self.__CACHE_DIR
+        self.max_bytes = max_bytes if max_bytes is not None else self.__MAX_BYTES
+        if ttl is None and self.__TTL:
+            ttl = float(self.__TTL)
+        self.ttl = ttl
+        self.decimals = decimals if decimals is not None else self.__DECIMALS
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.__conn = sqlite3.connect(os.path.join(self.cache_dir, "index.sqlite"), timeout=30, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "key TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries(accessed)")
+        self.__conn.commit()
+
+    def make_key(self, location, heading, size, fov, pitch):
+        """Construye la llave de la caché a partir de la coordenada redondeada y los parámetros de la toma."""
+        lat, lon = (float(value) for value in str(location).split(","))
+        return f"{lat:.{self.decimals}f},{lon:.{self.decimals}f}|h{heading}|s{size}|f{fov}|p{pitch}"
+
+    def __path_for(self, key):
+        digest = hashlib.sha1(key.encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.jpg")
+
+    def get(self, location, heading, size, fov, pitch):
+        """Devuelve el contenido cacheado de la imagen o None si no existe o expiró."""
+        key = self.make_key(location, heading, size, fov, pitch)
+        now = time.time()
+        with self.__lock:
+            row = self.__conn.execute("SELECT path, created FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self.__delete(key, row[0])
+                row = None
+            content = None
+            if row is not None:
+                try:
+                    with open(row[0], "rb") as f:
+                        content = f.read()
+                    self.__conn.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+                    self.__conn.commit()
+                except OSError:
+                    self.__delete(key, row[0])
+            if content is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return content
+
+    def put(self, location, heading, size, fov, pitch, content):
+        """Guarda una imagen en la caché y libera las entradas menos usadas si se supera el presupuesto."""
+        key = self.make_key(location, heading, size, fov, pitch)
+        path = self.__path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+        now = time.time()
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO entries (key, path, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, path, len(content), now, now)
+            )
+            self.__conn.commit()
+            self.__evict()
+
+    def __evict(self):
+        total = self.__conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, path, size in self.__conn.execute("SELECT key, path, size FROM entries ORDER BY accessed ASC").fetchall():
+            if total <= self.max_bytes:
+                break
+            self.__delete(key, path)
+            total -= size
+
+    def __delete(self, key, path):
+        self.__conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self.__conn.commit()
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def stats(self):
+        """Devuelve los contadores de aciertos/fallos y el tamaño actual de la caché."""
+        with self.__lock:
+            entries, total = self.__conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        requests_count = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests_count if requests_count else 0.0,
+            "entries": entries,
+            "bytes": total,
+            "max_bytes": self.max_bytes,
+        }
+
+
+def image_hash(img, perceptual=False):
+    """Huella de una imagen PIL: SHA-256 de los píxeles o, si `perceptual`, un dHash de 256 bits."""
+    if perceptual:
+        pixels = list(img.convert("L").resize((17, 16)).getdata())
+        bits = 0
+        for row in range(16):
+            for col in range(16):
+                bits = (bits << 1) | (pixels[row * 17 + col] > pixels[row * 17 + col + 1])
+        return f"d{bits:064x}"
+    digest = hashlib.sha256(f"{img.mode}{img.size}".encode("utf-8"))
+    digest.update(img.tobytes())
+    return digest.hexdigest()
+
+
+class AssessmentCache():
+    """Caché persistente de las evaluaciones de Gemini, por huella de imagen, versión del prompt y modelo.
+
+    Las entradas generadas con otro prompt se eliminan al abrir la caché, por lo que cambiar el prompt
+    invalida automáticamente los resultados anteriores.
+    """
+    __CACHE_DIR = os.getenv("GEMINI_CACHE_DIR", "./.cache/gemini")
+    __PERCEPTUAL = os.getenv("GEMINI_CACHE_PERCEPTUAL", "0") == "1"
+
+    def __init__(self, prompt, model, cache_dir=None, perceptual=None):
+        self.cache_dir = cache_dir or self.__CACHE_DIR
+        self.perceptual = self.__PERCEPTUAL if perceptual is None else perceptual
+        self.model = model
+        self.prompt_version = hashlib.sha256(prompt.encode("utf-8")).hexdigest()[:16]
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+        self.__lock = threading.Lock()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.__conn = sqlite3.connect(os.path.join(self.cache_dir, "assessments.sqlite"), timeout=30, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS assessments ("
+            "key TEXT PRIMARY KEY, model TEXT NOT NULL, prompt_version TEXT NOT NULL, "
+            "result TEXT NOT NULL, latency REAL NOT NULL, created REAL NOT NULL)"
+        )
+        self.__conn.execute("DELETE FROM assessments WHERE prompt_version != ?", (self.prompt_version,))
+        self.__conn.commit()
+
+    def make_key(self, img):
+        """Construye la llave a partir de la huella de la imagen, la versión del prompt y el modelo."""
+        return f"{image_hash(img, self.perceptual)}|{self.prompt_version}|{self.model}"
+
+    def get(self, key):
+        """Devuelve la evaluación cacheada o None."""
+        with self.__lock:
+            row = self.__conn.execute("SELECT result, latency FROM assessments WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self.saved_seconds += row[1]
+        return json.loads(row[0])
+
+    def put(self, key, result, latency):
+        """Guarda una evaluación junto con la latencia de la llamada remota que la produjo."""
+        with self.__lock:
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO assessments (key, model, prompt_version, result, latency, created) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, self.model, self.prompt_version, json.dumps(result, ensure_ascii=False), latency, time.time())
+            )
+            self.__conn.commit()
+
+    def stats(self):
+        """Devuelve la tasa de aciertos y el tiempo de llamadas remotas ahorrado."""
+        with self.__lock:
+            entries = self.__conn.execute("SELECT COUNT(*) FROM assessments").fetchone()[0]
+        requests_count = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / requests_count if requests_count else 0.0,
+            "saved_seconds": round(self.saved_seconds, 2),
+            "entries": entries,
+            "prompt_version": self.prompt_version,
+        }
@@ -0,0 +1,187 @@
+"""Barrido sin interfaz de varias zonas de la ciudad con un pool de procesos.
+
+Las zonas se leen de un CSV con las columnas `latitud,longitud,distancia,step` (y opcionalmente `circular`)
+o se generan teselando el área de servicio de 8 km. Cada proceso analiza una zona completa con su propio
+YOLO; las cachés de imágenes y evaluaciones (SQLite en modo WAL) se comparten entre procesos.
+
+El resultado es un único dataset particionado por zona:
+
+    <salida>/zona=<nombre>/resultados.csv   filas de la zona, con IPLU y prioridad
+    <salida>/zona=<nombre>/calles.csv       IPLU por tramo de calle (solo con --calles)
+    <salida>/resultados.csv                 todas las zonas consolidadas (columna Zona)
+    <salida>/zonas.csv                      resumen por zona (filas, IPLU medio, tiempo, error)
+
+Ejemplos:
+
+    python cli.py --zonas zonas.csv --workers 4 --salida barrido_nocturno
+    python cli.py --teselar 1000 --step 20 --workers 8
+    OSM_EXTRACT=medellin.osm python cli.py --teselar 1000 --step 20 --calles
+"""
+import argparse
+import concurrent.futures
+import multiprocessing
+import os
+import time
+
+import pandas as pd
+
+from geo_helper import teselar_area_servicio
+
+# Límites globales que se reparten entre los procesos para no multiplicarlos por el número de workers
+_LIMITES_COMPARTIDOS = {"GEMINI_RPS": "4", "STREET_VIEW_RPS": "25"}
+# Salidas de métricas que solo puede usar un proceso: el puerto no se comparte y el archivo se sobrescribiría
+_SOLO_PROCESO_PRINCIPAL = ("METRICS_PORT", "METRICS_FILE")
+
+
+def leer_zonas(path, step=None):
+    """Lee el CSV de zonas; `step` sustituye al de las filas que no lo definen."""
+    zonas = pd.read_csv(path)
+    faltantes = {"latitud", "longitud", "distancia"} - set(zonas.columns)
+    if faltantes:
+        raise ValueError(f"Al archivo de zonas le faltan las columnas: {', '.join(sorted(faltantes))}")
+    if "step" not in zonas.columns:
+        zonas["step"] = step
+    if step is not None:
+        zonas["step"] = zonas["step"].fillna(step)
+    if zonas["step"].isna().any():
+        raise ValueError("Hay zonas sin `step`; agréguelo al archivo o use --step")
+    if "circular" not in zonas.columns:
+        zonas["circular"] = False
+    zonas["circular"] = zonas["circular"].astype(str).str.strip().str.lower().isin(["1", "true", "si", "sí"])
+    return [
+        {"latitud": float(zona.latitud), "longitud": float(zona.longitud), "distancia": float(zona.distancia),
+         "step": float(zona.step), "circular": bool(zona.circular)}
+        for zona in zonas.itertuples(index=False)
+    ]
+
+
+def zonas_teseladas(lado, step):
+    return [{"latitud": float(latitud), "longitud": float(longitud), "distancia": float(lado),
+             "step": float(step), "circular": False}
+            for latitud, longitud in teselar_area_servicio(lado)]
+
+
+def nombre_zona(zona):
+    return f"LT{zona['latitud']:.6f}LG{zona['longitud']:.6f}".replace(".", "_")
+
+
+def _iniciar_worker(env):
+    # Se ejecuta antes de importar vision_helper, que lee su configuración del entorno al importarse
+    os.environ.update(env)
+
+
+def procesar_zona(zona, salida):
+    """Analiza una zona en el proceso actual y escribe su partición. Devuelve el resumen de la zona."""
+    from vision_helper import Basuras
+    from iplu_helper import agregar_iplu
+
+    start = time.monotonic()
+    nombre = nombre_zona(zona)
+    basuras = Basuras()
+    df = basuras.buscar_basuras_en_zona(f"{zona['latitud']:.6f}", f"{zona['longitud']:.6f}", zona["distancia"],
+                                        zona["step"], circular=zona["circular"], resume=not zona.get("forzar", False),
+                                        adaptive=zona.get("adaptativo", False), streets=zona.get("calles", False))
+    df = agregar_iplu(df)
+
+    particion = os.path.join(salida, f"zona={nombre}")
+    os.makedirs(particion, exist_ok=True)
+    if basuras.df_streets is not None:
+        basuras.df_streets.to_csv(os.path.join(particion, "calles.csv"), index=False)
+    tmp_path = os.path.join(particion, "resultados.csv.tmp")
+    df.to_csv(tmp_path, index=False)
+    os.replace(tmp_path, os.path.join(particion, "resultados.csv"))
+
+    return {**zona, "zona": nombre, "filas": len(df), "iplu_medio": round(float(df["IPLU"].mean()), 2) if len(df) else None,
+            "carpeta": basuras.results_folder, "segundos": round(time.monotonic() - start, 1), "error": None}
+
+
+def consolidar(salida):
+    """Une las particiones en `<salida>/resultados.csv`."""
+    partes = []
+    for entrada in sorted(os.scandir(salida), key=lambda entrada: entrada.name):
+        path = os.path.join(entrada.path, "resultados.csv")
+        if entrada.is_dir() and entrada.name.startswith("zona=") and os.path.exists(path):
+            parte = pd.read_csv(path)
+            parte.insert(0, "Zona", entrada.name.split("=", 1)[1])
+            partes.append(parte)
+    df = pd.concat(partes, ignore_index=True) if partes else pd.DataFrame()
+    df.to_csv(os.path.join(salida, "resultados.csv"), index=False)
+    return df
+
+
+def entorno_workers(workers, threads, salida):
+    env = {name: str(float(os.getenv(name, default)) / workers) for name, default in _LIMITES_COMPARTIDOS.items()}
+    env["OMP_NUM_THREADS"] = str(threads)
+    env["RESULTS_DIR"] = os.getenv("RESULTS_DIR", os.path.join(salida, "ejecuciones"))
+    # Vacías (y no ausentes) para que load_dotenv no las vuelva a cargar desde .env en el worker
+    env.update({name: "" for name in _SOLO_PROCESO_PRINCIPAL})
+    return env
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    origen = parser.add_mutually_exclusive_group(required=True)
+    origen.add_argument("--zonas", help="CSV con latitud,longitud,distancia,step[,circular]")
+    origen.add_argument("--teselar", type=float, metavar="LADO", help="teselar el área de servicio en zonas de LADO metros")
+    parser.add_argument("--step", type=float, default=None, help="separación entre puntos (metros)")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 2) // 2))
+    parser.add_argument("--salida", default=f"barrido_{time.strftime('%Y%m%d_%H%M%S')}")
+    parser.add_argument("--adaptativo", action="store_true", help="muestreo adaptativo: `step` pasa a ser el paso mínimo")
+    parser.add_argument("--calles", action="store_true",
+                        help="muestrear cada `step` metros sobre las calles del extracto OSM_EXTRACT")
+    parser.add_argument("--forzar", action="store_true", help="reprocesar zonas que ya tienen partición en la salida")
+    args = parser.parse_args()
+    if args.calles and args.adaptativo:
+        parser.error("--calles no se puede combinar con --adaptativo")
+
+    if args.teselar:
+        if args.step is None:
+            parser.error("--teselar requiere --step")
+        zonas = zonas_teseladas(args.teselar, args.step)
+    else:
+        zonas = leer_zonas(args.zonas, args.step)
+    for zona in zonas:
+        zona["adaptativo"] = args.adaptativo
+        zona["calles"] = args.calles
+        # Con --forzar tampoco se reanuda una ejecución interrumpida de la zona: se toman datos nuevos
+        zona["forzar"] = args.forzar
+
+    os.makedirs(args.salida, exist_ok=True)
+    if not args.forzar:
+        pendientes = [zona for zona in zonas
+                      if not os.path.exists(os.path.join(args.salida, f"zona={nombre_zona(zona)}", "resultados.csv"))]
+        if len(pendientes) < len(zonas):
+            print(f"{len(zonas) - len(pendientes)} zonas ya procesadas en {args.salida}, se omiten")
+        zonas = pendientes
+    print(f"{len(zonas)} zonas para procesar con {args.workers} procesos")
+
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    resumen = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=args.workers, mp_context=multiprocessing.get_context("spawn"),
+                                                initializer=_iniciar_worker,
+                                                initargs=(entorno_workers(args.workers, threads, args.salida),)) as pool:
+        futures = {pool.submit(procesar_zona, zona, args.salida): zona for zona in zonas}
+        for n, future in enumerate(concurrent.futures.as_completed(futures), start=1):
+            zona = futures[future]
+            try:
+                resultado = future.result()
+            except Exception as e:
+                resultado = {**zona, "zona": nombre_zona(zona), "filas": 0, "error": str(e)}
+            resumen.append(resultado)
+            estado = f"error: {resultado['error']}" if resultado["error"] else f"{resultado['filas']} filas"
+            print(f"[{n}/{len(zonas)}] {resultado['zona']}: {estado}")
+
+    resumen_path = os.path.join(args.salida, "zonas.csv")
+    resumen = pd.DataFrame(resumen)
+    if os.path.exists(resumen_path):
+        # Conserva el resumen de las zonas procesadas en ejecuciones anteriores del mismo barrido
+        resumen = pd.concat([pd.read_csv(resumen_path), resumen], ignore_index=True).drop_duplicates("zona", keep="last")
+    resumen.to_csv(resumen_path, index=False)
+    df = consolidar(args.salida)
+    errores = int(resumen["error"].notna().sum()) if "error" in resumen else 0
+    print(f"{len(df)} filas consolidadas en {args.salida}/resultados.csv ({errores} zonas con error)")
+    return 1 if errores else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
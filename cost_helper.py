@@ -0,0 +1,101 @@
+import os
+import math
+import sqlite3
+import threading
+import time
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class CostModel():
+    """Precios y consumos por llamada (configurables por entorno) para estimar el costo de una ejecución.
+
+    Cada punto pendiente genera una consulta de metadatos (sin costo), hasta 4 imágenes de Street View Static
+    (una por orientación) y su parte de una llamada a Gemini. Las cifras de panorámicas son un máximo: los
+    puntos que comparten panorámica o que no tienen cobertura solo se conocen al consultar los metadatos.
+    """
+    HEADINGS = 4
+    __STREET_VIEW_PRICE = float(os.getenv("STREET_VIEW_PRICE_PER_1000", "7.0"))
+    __GEMINI_INPUT_PRICE = float(os.getenv("GEMINI_INPUT_PRICE_PER_M", "0.10"))
+    __GEMINI_OUTPUT_PRICE = float(os.getenv("GEMINI_OUTPUT_PRICE_PER_M", "0.40"))
+    __IMAGE_TOKENS = int(os.getenv("GEMINI_TOKENS_PER_IMAGE", "1032"))  # 2400x300 en recortes de 768 px
+    __OUTPUT_TOKENS = int(os.getenv("GEMINI_OUTPUT_TOKENS_PER_IMAGE", "150"))
+    __IMAGE_BYTES = int(os.getenv("STREET_VIEW_IMAGE_BYTES", "40000"))
+
+    def estimar(self, puntos, reutilizados, pendientes, prompt_tokens, batch_size=1):
+        """Estimación de llamadas, tokens, bytes y dólares para `pendientes` puntos nuevos."""
+        batch_size = max(1, batch_size)
+        street_view = pendientes * self.HEADINGS
+        gemini = math.ceil(pendientes / batch_size)
+        tokens_entrada = gemini * prompt_tokens + pendientes * self.__IMAGE_TOKENS
+        tokens_salida = pendientes * self.__OUTPUT_TOKENS
+        costo_street_view = street_view / 1000 * self.__STREET_VIEW_PRICE
+        costo_gemini = (tokens_entrada * self.__GEMINI_INPUT_PRICE + tokens_salida * self.__GEMINI_OUTPUT_PRICE) / 1e6
+        return {
+            "puntos": puntos,
+            "reutilizados": reutilizados,
+            "pendientes": pendientes,
+            "llamadas_metadatos": pendientes,
+            "llamadas_street_view": street_view,
+            "llamadas_gemini": gemini,
+            "tokens_entrada": tokens_entrada,
+            "tokens_salida": tokens_salida,
+            "bytes_descarga": street_view * self.__IMAGE_BYTES,
+            "costo_street_view_usd": round(costo_street_view, 4),
+            "costo_gemini_usd": round(costo_gemini, 4),
+            "costo_total_usd": round(costo_street_view + costo_gemini, 4),
+        }
+
+
+class DailyQuota():
+    """Cupo diario de puntos compartido por todos los procesos que usan el mismo directorio.
+
+    `reservar` descuenta el cupo de forma atómica (transacción inmediata de SQLite), por lo que varios
+    workers de la CLI o del servicio de trabajos no pueden excederlo entre todos.
+    """
+    __QUOTA_DIR = os.getenv("QUOTA_DIR", "./.cache/quota")
+    __MAX_POINTS = int(os.getenv("DAILY_MAX_POINTS", "0"))  # 0 = sin límite
+
+    def __init__(self, max_points=None, quota_dir=None):
+        self.max_points = self.__MAX_POINTS if max_points is None else max_points
+        self.quota_dir = quota_dir or self.__QUOTA_DIR
+        self.__lock = threading.Lock()
+        os.makedirs(self.quota_dir, exist_ok=True)
+        self.__conn = sqlite3.connect(os.path.join(self.quota_dir, "quota.sqlite"), timeout=30,
+                                      check_same_thread=False, isolation_level=None)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute("CREATE TABLE IF NOT EXISTS usage (day TEXT PRIMARY KEY, points INTEGER NOT NULL)")
+
+    @staticmethod
+    def today():
+        return time.strftime("%Y-%m-%d")
+
+    def usados(self, day=None):
+        with self.__lock:
+            row = self.__conn.execute("SELECT points FROM usage WHERE day = ?", (day or self.today(),)).fetchone()
+        return row[0] if row else 0
+
+    def disponibles(self):
+        """Puntos que quedan hoy, o None si no hay límite."""
+        if not self.max_points:
+            return None
+        return max(0, self.max_points - self.usados())
+
+    def reservar(self, puntos):
+        """Descuenta hasta `puntos` del cupo de hoy y devuelve cuántos se concedieron."""
+        if puntos <= 0:
+            return 0
+        day = self.today()
+        with self.__lock:
+            self.__conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.__conn.execute("SELECT points FROM usage WHERE day = ?", (day,)).fetchone()
+                usados = row[0] if row else 0
+                concedidos = puntos if not self.max_points else max(0, min(puntos, self.max_points - usados))
+                self.__conn.execute("INSERT OR REPLACE INTO usage (day, points) VALUES (?, ?)", (day, usados + concedidos))
+                self.__conn.execute("COMMIT")
+            except Exception:
+                self.__conn.execute("ROLLBACK")
+                raise
+        return concedidos
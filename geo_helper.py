@@ -0,0 +1,135 @@
+import numpy as np
+
+# Área de servicio: círculo de 8 km alrededor del centro de Medellín
+CENTRO_MEDELLIN = (6.2442, -75.5812)
+RADIO_SERVICIO_KM = 8
+
+# Elipsoide WGS84
+_WGS84_A = 6378137.0
+_WGS84_E2 = 6.69437999014e-3
+
+
+def radios_locales(latitud):
+    """Radios de curvatura meridiano y del primer vertical (metros) en una latitud dada."""
+    phi = np.radians(latitud)
+    w = 1 - _WGS84_E2 * np.sin(phi) ** 2
+    radio_meridiano = _WGS84_A * (1 - _WGS84_E2) / w ** 1.5
+    radio_vertical = _WGS84_A / np.sqrt(w)
+    return radio_meridiano, radio_vertical * np.cos(phi)
+
+
+def desplazar(latitud, longitud, norte, este):
+    """Desplaza una coordenada `norte`/`este` metros (escalares o arrays) con una proyección local."""
+    radio_meridiano, radio_paralelo = radios_locales(latitud)
+    return (latitud + np.degrees(np.asarray(norte) / radio_meridiano),
+            longitud + np.degrees(np.asarray(este) / radio_paralelo))
+
+
+def distancia_metros(latitudes, longitudes, centro):
+    """Distancia en metros de cada punto al centro, vectorizada (proyección local, error < 0.1% en 10 km)."""
+    radio_meridiano, radio_paralelo = radios_locales(centro[0])
+    norte = np.radians(np.asarray(latitudes) - centro[0]) * radio_meridiano
+    este = np.radians(np.asarray(longitudes) - centro[1]) * radio_paralelo
+    return np.hypot(norte, este)
+
+
+def generar_puntos(latitud, longitud, distancia, step, circular=False, area_servicio=True):
+    """Genera la malla de puntos de análisis como un array (N, 2) de [latitud, longitud].
+
+    Con `circular=False` se conserva la malla cuadrada de lado `distancia` centrada en el punto.
+    Con `circular=True` se usa una malla centrada en el punto y se recorta al círculo de radio `distancia`.
+    Con `area_servicio=True` se descartan los puntos fuera del área de servicio de Medellín.
+    """
+    latitud, longitud = float(latitud), float(longitud)
+    if circular:
+        offsets = np.arange(0, distancia + step / 2, step)
+        offsets = np.concatenate([-offsets[:0:-1], offsets])
+    else:
+        offsets = np.arange(-distancia / 2, distancia / 2, step)
+
+    norte, este = np.meshgrid(offsets, offsets, indexing="ij")
+    norte, este = norte.ravel(), este.ravel()
+    if circular:
+        dentro = np.hypot(norte, este) <= distancia
+        norte, este = norte[dentro], este[dentro]
+
+    latitudes, longitudes = desplazar(latitud, longitud, norte, este)
+    if area_servicio:
+        dentro = distancia_metros(latitudes, longitudes, CENTRO_MEDELLIN) <= RADIO_SERVICIO_KM * 1000
+        latitudes, longitudes = latitudes[dentro], longitudes[dentro]
+
+    return np.column_stack([latitudes, longitudes])
+
+
+def teselar_area_servicio(lado, centro=CENTRO_MEDELLIN, radio_km=RADIO_SERVICIO_KM):
+    """Centros de las zonas cuadradas de lado `lado` (metros) que cubren el área de servicio.
+
+    Las zonas no se solapan: con `generar_puntos(..., distancia=lado)` y un `lado` múltiplo de `step`,
+    las mallas de zonas vecinas quedan contiguas. Se descartan las zonas que no tocan el círculo.
+    """
+    radio = radio_km * 1000
+    desplazamientos = np.arange(-radio, radio + lado, lado)
+    norte, este = np.meshgrid(desplazamientos, desplazamientos, indexing="ij")
+    norte, este = norte.ravel(), este.ravel()
+    # Distancia del centro del área al punto más cercano de cada cuadrado
+    cercano = np.hypot(np.maximum(np.abs(norte) - lado / 2, 0), np.maximum(np.abs(este) - lado / 2, 0))
+    norte, este = norte[cercano <= radio], este[cercano <= radio]
+    latitudes, longitudes = desplazar(centro[0], centro[1], norte, este)
+    return np.column_stack([latitudes, longitudes])
+
+
+def subdividir(puntos, lado, area_servicio=True):
+    """Refina las celdas de lado `lado` ancladas en cada punto a la malla de lado `lado / 2`.
+
+    Cada celda conserva su punto y aporta los 3 puntos nuevos (norte, este y noreste a `lado / 2`), de modo
+    que la malla refinada coincide con la malla uniforme de paso `lado / 2`.
+    """
+    puntos = np.asarray(puntos, dtype=float).reshape(-1, 2)
+    norte = np.array([lado / 2, 0, lado / 2])
+    este = np.array([0, lado / 2, lado / 2])
+    latitudes, longitudes = desplazar(puntos[:, :1], puntos[:, 1:], norte[None, :], este[None, :])
+    latitudes, longitudes = latitudes.ravel(), longitudes.ravel()
+
+    if area_servicio:
+        dentro = distancia_metros(latitudes, longitudes, CENTRO_MEDELLIN) <= RADIO_SERVICIO_KM * 1000
+        latitudes, longitudes = latitudes[dentro], longitudes[dentro]
+    return np.column_stack([latitudes, longitudes])
+
+
+def dentro_de_zona(puntos, latitud, longitud, distancia, circular=False):
+    """Máscara de los puntos que caen en la zona de `generar_puntos` con los mismos parámetros."""
+    puntos = np.asarray(puntos, dtype=float).reshape(-1, 2)
+    latitud, longitud = float(latitud), float(longitud)
+    if circular:
+        return distancia_metros(puntos[:, 0], puntos[:, 1], (latitud, longitud)) <= distancia
+    radio_meridiano, radio_paralelo = radios_locales(latitud)
+    norte = np.radians(puntos[:, 0] - latitud) * radio_meridiano
+    este = np.radians(puntos[:, 1] - longitud) * radio_paralelo
+    return (np.abs(norte) <= distancia / 2) & (np.abs(este) <= distancia / 2)
+
+
+def discrepancia_vecinos(puntos, valores, lado):
+    """Máxima diferencia absoluta entre el valor de cada punto y el de sus vecinos a `lado` metros (N, S, E, O).
+
+    Los puntos deben estar sobre una malla de paso `lado`; los valores faltantes (NaN) se ignoran.
+    """
+    puntos = np.asarray(puntos, dtype=float).reshape(-1, 2)
+    valores = np.asarray(valores, dtype=float)
+    if not len(puntos):
+        return np.zeros(0)
+    # El primer punto sirve de origen: así las posiciones en la malla son enteras
+    centro = puntos[0]
+    radio_meridiano, radio_paralelo = radios_locales(centro[0])
+    filas = np.rint(np.radians(puntos[:, 0] - centro[0]) * radio_meridiano / lado).astype(int)
+    columnas = np.rint(np.radians(puntos[:, 1] - centro[1]) * radio_paralelo / lado).astype(int)
+    indice = {celda: i for i, celda in enumerate(zip(filas.tolist(), columnas.tolist()))}
+
+    discrepancia = np.zeros(len(puntos))
+    for i, (fila, columna) in enumerate(zip(filas.tolist(), columnas.tolist())):
+        for vecino in ((fila + 1, columna), (fila - 1, columna), (fila, columna + 1), (fila, columna - 1)):
+            j = indice.get(vecino)
+            if j is not None:
+                diferencia = abs(valores[i] - valores[j])
+                if diferencia > discrepancia[i]:  # NaN nunca es mayor
+                    discrepancia[i] = diferencia
+    return discrepancia
@@ -0,0 +1,56 @@
+import numpy as np
+import pandas as pd
+
+# Índice de Priorización de Limpieza Urbana (IPLU)
+PUNTOS_INTENSIDAD = {'No Aplica': 0, 'Leve': 1, 'Moderada': 2, 'Alta': 3}
+PUNTOS_URGENCIA = {'No urgente': 0, 'Moderadamente urgente': 2, 'Urgente': 4}
+PUNTOS_ACUMULACION = {'Sí': 2, 'No': 0}
+PUNTOS_PAPELERAS = {'Sí': 0, 'No': 2}
+
+# (límite superior, nivel, descripción, color)
+NIVELES_PRIORIDAD = [
+    (5, "Baja Prioridad", "Zona limpia. Se recomienda monitoreo regular.", "#4CAF50"),
+    (10, "Media Prioridad", "Zona con cierta acumulación de residuos. Se requiere seguimiento frecuente.", "#FFC107"),
+    (15, "Alta Prioridad", "Zona con acumulación significativa de basura. Atención urgente necesaria.", "#FF5722"),
+    (np.inf, "Crítica", "Zona en condiciones críticas de limpieza. Se requiere intervención inmediata.", "#F44336"),
+]
+
+
+def _puntos(serie, puntos, por_defecto=0):
+    """Traduce una columna categórica a puntos usando sus códigos (sin recorrer fila por fila)."""
+    tabla = np.array([puntos.get(categoria, por_defecto) for categoria in serie.cat.categories] + [por_defecto], dtype=float)
+    return tabla[serie.cat.codes.to_numpy()]
+
+
+def calcular_iplu(df):
+    """Calcula el IPLU de cada fila a partir de las columnas de evaluación ya tipadas."""
+    nsv_1 = (df['limpieza_general'].astype(float) - 10).abs().to_numpy()
+    nsv = np.where(nsv_1 <= 6, nsv_1 * 2, nsv_1 * 0.5)
+    aeb = _puntos(df['intensidad_basura'], PUNTOS_INTENSIDAD)
+    acb = _puntos(df['acumulacion_basura'], PUNTOS_ACUMULACION)
+    ur = _puntos(df['recoleccion_urgente'], PUNTOS_URGENCIA)
+    pcv = _puntos(df['papeleras_presentes'], PUNTOS_PAPELERAS, por_defecto=2)
+    return pd.Series(nsv + aeb + ur + pcv + acb, index=df.index, name='IPLU')
+
+
+def bandas_prioridad(iplu):
+    """Nivel de prioridad de cada valor de IPLU como columna categórica."""
+    limites = [-np.inf] + [limite for limite, *_ in NIVELES_PRIORIDAD]
+    niveles = [nivel for _, nivel, *_ in NIVELES_PRIORIDAD]
+    return pd.cut(iplu, bins=limites, labels=niveles, right=True)
+
+
+def clasificar_iplu(valor):
+    """Devuelve (nivel, descripción, color) para un valor de IPLU."""
+    for limite, nivel, descripcion, color in NIVELES_PRIORIDAD:
+        if valor <= limite:
+            return nivel, descripcion, color
+    return NIVELES_PRIORIDAD[-1][1:]
+
+
+def agregar_iplu(df):
+    """Agrega las columnas IPLU y Prioridad a un DataFrame de resultados."""
+    df = df.copy()
+    df['IPLU'] = calcular_iplu(df)
+    df['Prioridad'] = bandas_prioridad(df['IPLU'])
+    return df
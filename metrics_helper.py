@@ -0,0 +1,215 @@
+import os
+import json
+import time
+import threading
+import contextlib
+import contextvars
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+# Registro de la ejecución en curso en este contexto (ver Metrics.run_scope)
+_RUN_METRICS = contextvars.ContextVar("run_metrics", default=None)
+
+
+class _Timing():
+    outcome = "success"
+
+
+class Metrics():
+    """Registro de métricas del proceso (contadores, gauges e histogramas) en formato Prometheus."""
+    __HOST = os.getenv("METRICS_HOST", "127.0.0.1")  # 0.0.0.0 para exponerlas en todas las interfaces
+    BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+    __HELP = {
+        "basuras_stage_seconds": "Duración de cada etapa del análisis.",
+        "basuras_stage_total": "Ejecuciones de cada etapa por resultado.",
+        "basuras_streetview_requests_total": "Peticiones a Street View Static por resultado.",
+        "basuras_streetview_request_seconds": "Duración de cada petición a Street View Static.",
+        "basuras_streetview_bytes_total": "Bytes descargados de Street View Static.",
+        "basuras_gemini_images_total": "Imágenes enviadas a Gemini.",
+        "basuras_yolo_images_total": "Imágenes clasificadas con YOLO.",
+        "basuras_cascade_total": "Decisiones de la cascada YOLO → Gemini (skip, audit, gemini).",
+        "basuras_cascade_audit_total": "Auditorías de la cascada por concordancia con Gemini.",
+        "basuras_queue_depth": "Elementos en la cola de entrada de cada etapa del pipeline.",
+        "basuras_points_total": "Puntos de la malla por resultado.",
+    }
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__counters = {}
+        self.__gauges = {}
+        self.__histograms = {}
+        self.__server = None
+
+    @staticmethod
+    def __key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def __run(self):
+        """Registro de la ejecución del contexto actual, al que también se copia cada medición."""
+        run = _RUN_METRICS.get()
+        return run if run is not self else None
+
+    def inc(self, name, value=1, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            self.__counters[key] = self.__counters.get(key, 0) + value
+        run = self.__run()
+        if run is not None:
+            run.inc(name, value, **labels)
+
+    def set_gauge(self, name, value, **labels):
+        with self.__lock:
+            self.__gauges[self.__key(name, labels)] = value
+        run = self.__run()
+        if run is not None:
+            run.set_gauge(name, value, **labels)
+
+    def observe(self, name, seconds, **labels):
+        key = self.__key(name, labels)
+        with self.__lock:
+            histogram = self.__histograms.get(key)
+            if histogram is None:
+                histogram = self.__histograms[key] = {"buckets": [0] * len(self.BUCKETS), "count": 0, "sum": 0.0}
+            histogram["count"] += 1
+            histogram["sum"] += seconds
+            for i, bound in enumerate(self.BUCKETS):
+                if seconds <= bound:
+                    histogram["buckets"][i] += 1
+        run = self.__run()
+        if run is not None:
+            run.observe(name, seconds, **labels)
+
+    @contextlib.contextmanager
+    def run_scope(self):
+        """Registro propio de una ejecución. Lo que se mide dentro del bloque, y en los hilos o tareas que copian
+        su contexto, se anota también en él; así varias ejecuciones simultáneas del mismo proceso no se mezclan."""
+        run = Metrics()
+        token = _RUN_METRICS.set(run)
+        try:
+            yield run
+        finally:
+            try:
+                _RUN_METRICS.reset(token)
+            except ValueError:
+                # Un generador cerrado desde otro contexto no puede restaurar el anterior
+                pass
+
+    @contextlib.contextmanager
+    def timer(self, stage, **labels):
+        """Mide una etapa; el bloque puede marcar `timing.outcome = "failure"` sin lanzar una excepción."""
+        timing = _Timing()
+        start = time.perf_counter()
+        try:
+            yield timing
+        except Exception:
+            timing.outcome = "failure"
+            raise
+        finally:
+            self.observe("basuras_stage_seconds", time.perf_counter() - start, stage=stage, **labels)
+            self.inc("basuras_stage_total", stage=stage, outcome=timing.outcome, **labels)
+
+    def snapshot(self):
+        """Copia de los contadores e histogramas, para calcular el resumen de una ejecución."""
+        with self.__lock:
+            return {
+                "counters": dict(self.__counters),
+                "histograms": {key: {"count": h["count"], "sum": h["sum"]} for key, h in self.__histograms.items()},
+            }
+
+    def run_summary(self, before=None):
+        """Diferencia entre el estado actual y `before` (o todo, en el registro de una ejecución): tiempos y
+        contadores de una sola ejecución."""
+        before = before or {"counters": {}, "histograms": {}}
+        after = self.snapshot()
+        stages = {}
+        for (name, labels), histogram in after["histograms"].items():
+            previous = before["histograms"].get((name, labels), {"count": 0, "sum": 0.0})
+            count = histogram["count"] - previous["count"]
+            if not count:
+                continue
+            seconds = histogram["sum"] - previous["sum"]
+            stages[self.__format_name(name, labels)] = {
+                "count": count,
+                "seconds_total": round(seconds, 3),
+                "mean_ms": round(1000 * seconds / count, 1),
+            }
+        counters = {}
+        for (name, labels), value in after["counters"].items():
+            delta = value - before["counters"].get((name, labels), 0)
+            if delta:
+                counters[self.__format_name(name, labels)] = delta
+        return {"timings": stages, "counters": counters}
+
+    @staticmethod
+    def __format_labels(labels):
+        if not labels:
+            return ""
+        return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+    def __format_name(self, name, labels):
+        return name + self.__format_labels(labels)
+
+    def render(self):
+        """Exposición en formato de texto de Prometheus."""
+        lines = []
+        seen = set()
+
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                lines.append(f"# HELP {name} {self.__HELP.get(name, name)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        with self.__lock:
+            for (name, labels), value in sorted(self.__counters.items()):
+                header(name, "counter")
+                lines.append(f"{self.__format_name(name, labels)} {value}")
+            for (name, labels), value in sorted(self.__gauges.items()):
+                header(name, "gauge")
+                lines.append(f"{self.__format_name(name, labels)} {value}")
+            for (name, labels), histogram in sorted(self.__histograms.items()):
+                header(name, "histogram")
+                for bound, count in zip(self.BUCKETS, histogram["buckets"]):
+                    lines.append(f"{name}_bucket{self.__format_labels(labels + (('le', bound),))} {count}")
+                lines.append(f"{name}_bucket{self.__format_labels(labels + (('le', '+Inf'),))} {histogram['count']}")
+                lines.append(f"{name}_sum{self.__format_labels(labels)} {histogram['sum']}")
+                lines.append(f"{name}_count{self.__format_labels(labels)} {histogram['count']}")
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Escribe la exposición en un archivo (p. ej. para el textfile collector de node_exporter)."""
+        # Archivo temporal por proceso: varios workers pueden escribir la misma ruta
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp_path, path)
+
+    def serve(self, port, host=None):
+        """Publica las métricas en http://<METRICS_HOST>:<port>/metrics (una sola vez por proceso)."""
+        if self.__server is not None:
+            return self.__server
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                body = metrics.render().encode("utf-8")
+                self.send_response(200 if self.path.startswith("/metrics") else 404)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        self.__server = ThreadingHTTPServer((host or self.__HOST, int(port)), Handler)
+        threading.Thread(target=self.__server.serve_forever, name="metrics", daemon=True).start()
+        return self.__server
+
+
+METRICS = Metrics()
+
+
+def write_run_summary(path, summary):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, default=str)
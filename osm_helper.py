@@ -0,0 +1,266 @@
+import os
+import sys
+import json
+import threading
+import xml.etree.ElementTree as ET
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from geo_helper import CENTRO_MEDELLIN, RADIO_SERVICIO_KM, radios_locales, distancia_metros, dentro_de_zona
+from iplu_helper import agregar_iplu, bandas_prioridad
+
+load_dotenv()
+
+# Vías por las que circulan vehículos o peatones y que suelen tener cobertura de Street View
+_VIAS_POR_DEFECTO = ("motorway,trunk,primary,secondary,tertiary,unclassified,residential,living_street,service,"
+                     "pedestrian,motorway_link,trunk_link,primary_link,secondary_link,tertiary_link")
+
+
+class RedVial():
+    """Red vial de un extracto local de OpenStreetMap (.osm XML o GeoJSON) con un índice espacial de segmentos.
+
+    Las vías se cortan en tramos entre intersecciones (nodos compartidos por varias vías): cada tramo es la
+    unidad sobre la que se muestrean puntos y se agrega el IPLU. Las coordenadas se guardan en metros en una
+    proyección local centrada en Medellín y los segmentos se indexan en una rejilla de celdas de
+    `celda` metros, de modo que las consultas por zona o por punto solo recorren las celdas vecinas.
+    """
+    __EXTRACT = os.getenv("OSM_EXTRACT", "")
+    __HIGHWAYS = {via.strip() for via in os.getenv("OSM_HIGHWAYS", _VIAS_POR_DEFECTO).split(",") if via.strip()}
+    __INDEX_CELL = float(os.getenv("OSM_INDEX_CELL", "200"))
+    __redes = {}
+    __redes_lock = threading.Lock()
+
+    def __init__(self, path, highways=None, celda=None):
+        self.path = path
+        self.highways = set(highways or self.__HIGHWAYS)
+        self.celda = celda or self.__INDEX_CELL
+        self.origen = CENTRO_MEDELLIN
+        self.__radios = radios_locales(self.origen[0])
+
+        vias = self.__leer_geojson(path) if path.lower().endswith((".geojson", ".json")) else self.__leer_osm(path)
+        self.tramos = pd.DataFrame(columns=["Tramo", "Via", "Nombre", "Tipo", "Longitud"])
+        self.__geometrias = []
+        self.__construir_tramos(vias)
+        self.__construir_indice()
+
+    @classmethod
+    def disponible(cls):
+        return bool(cls.__EXTRACT) and os.path.exists(cls.__EXTRACT)
+
+    @classmethod
+    def cargar(cls, path=None):
+        """Devuelve la red del extracto (OSM_EXTRACT por defecto), leída e indexada una sola vez por proceso."""
+        path = os.path.abspath(path or cls.__EXTRACT)
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"No se encontró el extracto de OpenStreetMap {path!r}; configure OSM_EXTRACT")
+        with cls.__redes_lock:
+            red = cls.__redes.get(path)
+            if red is None:
+                red = cls.__redes[path] = cls(path)
+            return red
+
+    def __proyectar(self, latitudes, longitudes):
+        radio_meridiano, radio_paralelo = self.__radios
+        norte = np.radians(np.asarray(latitudes, dtype=float) - self.origen[0]) * radio_meridiano
+        este = np.radians(np.asarray(longitudes, dtype=float) - self.origen[1]) * radio_paralelo
+        return np.column_stack([norte, este])
+
+    def __geografica(self, xy):
+        radio_meridiano, radio_paralelo = self.__radios
+        return np.column_stack([self.origen[0] + np.degrees(xy[:, 0] / radio_meridiano),
+                                self.origen[1] + np.degrees(xy[:, 1] / radio_paralelo)])
+
+    def __leer_osm(self, path):
+        """Lee nodos y vías de un .osm en streaming. Devuelve [(id, nombre, tipo, coordenadas, cortes), ...], donde
+        `cortes` marca los nodos compartidos con otras vías (intersecciones) y los extremos."""
+        nodos, vias = {}, []
+        for _, elemento in ET.iterparse(path, events=("end",)):
+            if elemento.tag == "node":
+                nodos[elemento.get("id")] = (float(elemento.get("lat")), float(elemento.get("lon")))
+                elemento.clear()
+            elif elemento.tag == "way":
+                tags = {tag.get("k"): tag.get("v") for tag in elemento.iter("tag")}
+                if tags.get("highway") in self.highways and tags.get("area") != "yes":
+                    refs = [nd.get("ref") for nd in elemento.iter("nd")]
+                    vias.append((elemento.get("id"), tags.get("name"), tags["highway"], refs))
+                elemento.clear()
+            elif elemento.tag == "relation":
+                elemento.clear()
+
+        usos = {}
+        for *_, refs in vias:
+            for ref in set(refs):
+                usos[ref] = usos.get(ref, 0) + 1
+        # Los extremos de cada vía también cortan tramos
+        compartidos = {ref for ref, n in usos.items() if n > 1}
+        for *_, refs in vias:
+            if refs:
+                compartidos.update((refs[0], refs[-1]))
+        coordenadas = [(via_id, nombre, tipo, [nodos[ref] for ref in refs if ref in nodos],
+                        [ref in compartidos for ref in refs if ref in nodos])
+                       for via_id, nombre, tipo, refs in vias]
+        return coordenadas
+
+    def __leer_geojson(self, path):
+        """Lee las líneas de un GeoJSON (p. ej. exportado con osmium u ogr2ogr); cada línea es un tramo."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        vias = []
+        for n, feature in enumerate(data.get("features", [])):
+            propiedades = feature.get("properties") or {}
+            geometria = feature.get("geometry") or {}
+            if propiedades.get("highway") not in self.highways:
+                continue
+            via_id = str(propiedades.get("@id") or propiedades.get("osm_id") or feature.get("id") or n)
+            lineas = ([geometria.get("coordinates", [])] if geometria.get("type") == "LineString"
+                      else geometria.get("coordinates", []) if geometria.get("type") == "MultiLineString" else [])
+            for linea in lineas:
+                # GeoJSON usa [longitud, latitud]
+                vias.append((via_id, propiedades.get("name"), propiedades["highway"],
+                             [(lat, lon) for lon, lat, *_ in linea], None))
+        return vias
+
+    def __construir_tramos(self, vias):
+        filas = []
+        for via_id, nombre, tipo, coordenadas, cortes in vias:
+            if len(coordenadas) < 2:
+                continue
+            xy = self.__proyectar([c[0] for c in coordenadas], [c[1] for c in coordenadas])
+            limites = [i for i, corte in enumerate(cortes) if corte] if cortes else [0, len(xy) - 1]
+            if limites[0] != 0:
+                limites.insert(0, 0)
+            if limites[-1] != len(xy) - 1:
+                limites.append(len(xy) - 1)
+            for k, (inicio, fin) in enumerate(zip(limites[:-1], limites[1:])):
+                geometria = xy[inicio:fin + 1]
+                longitud = float(np.hypot(*np.diff(geometria, axis=0).T).sum())
+                if longitud <= 0:
+                    continue
+                filas.append((f"{via_id}:{k}", via_id, nombre, tipo, round(longitud, 1)))
+                self.__geometrias.append(geometria)
+        if filas:
+            self.tramos = pd.DataFrame(filas, columns=["Tramo", "Via", "Nombre", "Tipo", "Longitud"])
+
+    def __construir_indice(self):
+        """Segmentos (inicio, fin, tramo) y rejilla {celda: índices de segmento} de todas las celdas que toca
+        la caja de cada segmento."""
+        if not self.__geometrias:
+            self.__inicio, self.__fin, self.__tramo = np.zeros((0, 2)), np.zeros((0, 2)), np.zeros(0, dtype=int)
+            self.__rejilla = {}
+            return
+        self.__inicio = np.concatenate([g[:-1] for g in self.__geometrias])
+        self.__fin = np.concatenate([g[1:] for g in self.__geometrias])
+        self.__tramo = np.concatenate([np.full(len(g) - 1, i) for i, g in enumerate(self.__geometrias)])
+
+        minimos = np.floor(np.minimum(self.__inicio, self.__fin) / self.celda).astype(int)
+        maximos = np.floor(np.maximum(self.__inicio, self.__fin) / self.celda).astype(int)
+        self.__rejilla = {}
+        for s, (f0, c0, f1, c1) in enumerate(np.column_stack([minimos, maximos]).tolist()):
+            for fila in range(f0, f1 + 1):
+                for columna in range(c0, c1 + 1):
+                    self.__rejilla.setdefault((fila, columna), []).append(s)
+
+    def __segmentos_en(self, minimo, maximo):
+        """Índices de los segmentos de las celdas que cubren el rectángulo (en metros)."""
+        f0, c0 = np.floor(np.asarray(minimo) / self.celda).astype(int)
+        f1, c1 = np.floor(np.asarray(maximo) / self.celda).astype(int)
+        segmentos = set()
+        for fila in range(f0, f1 + 1):
+            for columna in range(c0, c1 + 1):
+                segmentos.update(self.__rejilla.get((fila, columna), ()))
+        return np.fromiter(segmentos, dtype=int, count=len(segmentos))
+
+    def puntos_en_calles(self, latitud, longitud, distancia, step, circular=False, area_servicio=True):
+        """Puntos cada `step` metros a lo largo de los tramos que cruzan la zona de `generar_puntos` con los
+        mismos parámetros. Devuelve (array (N, 2) de [latitud, longitud], array (N,) con el índice del tramo).
+
+        En las intersecciones, los puntos de tramos distintos que caen en la misma celda de `step / 2` metros
+        se dejan una sola vez.
+        """
+        latitud, longitud = float(latitud), float(longitud)
+        centro = self.__proyectar([latitud], [longitud])[0]
+        alcance = distancia if circular else distancia / 2
+        segmentos = self.__segmentos_en(centro - alcance, centro + alcance)
+        tramos = np.unique(self.__tramo[segmentos])
+
+        puntos, indices = [], []
+        for t in tramos.tolist():
+            geometria = self.__geometrias[t]
+            largos = np.hypot(*np.diff(geometria, axis=0).T)
+            acumulado = np.concatenate([[0.0], np.cumsum(largos)])
+            # Centrados en el tramo: los extremos (intersecciones) quedan a la misma distancia de sus vecinos
+            n = max(1, int(acumulado[-1] // step) + 1)
+            recorrido = (acumulado[-1] - (n - 1) * step) / 2 + np.arange(n) * step
+            puntos.append(np.column_stack([np.interp(recorrido, acumulado, geometria[:, 0]),
+                                           np.interp(recorrido, acumulado, geometria[:, 1])]))
+            indices.append(np.full(n, t))
+        if not puntos:
+            return np.zeros((0, 2)), np.zeros(0, dtype=int)
+        xy, indices = np.concatenate(puntos), np.concatenate(indices)
+
+        celdas = np.floor(xy / (step / 2)).astype(int)
+        _, primeros = np.unique(celdas, axis=0, return_index=True)
+        primeros = np.sort(primeros)
+        xy, indices = xy[primeros], indices[primeros]
+
+        coordenadas = self.__geografica(xy)
+        dentro = dentro_de_zona(coordenadas, latitud, longitud, distancia, circular)
+        if area_servicio:
+            dentro &= distancia_metros(coordenadas[:, 0], coordenadas[:, 1], CENTRO_MEDELLIN) <= RADIO_SERVICIO_KM * 1000
+        return coordenadas[dentro], indices[dentro]
+
+    def tramo_mas_cercano(self, puntos, max_distancia=30):
+        """Índice del tramo más cercano a cada punto (array (N, 2)), o -1 si no hay uno a menos de `max_distancia`."""
+        puntos = np.asarray(puntos, dtype=float).reshape(-1, 2)
+        resultado = np.full(len(puntos), -1)
+        if not len(puntos) or not len(self.__tramo):
+            return resultado
+        xy = self.__proyectar(puntos[:, 0], puntos[:, 1])
+        for j, p in enumerate(xy):
+            segmentos = self.__segmentos_en(p - max_distancia, p + max_distancia)
+            if not len(segmentos):
+                continue
+            a, b = self.__inicio[segmentos], self.__fin[segmentos]
+            ab = b - a
+            t = np.clip(((p - a) * ab).sum(axis=1) / np.maximum((ab * ab).sum(axis=1), 1e-9), 0, 1)
+            distancias = np.hypot(*(a + ab * t[:, None] - p).T)
+            k = int(np.argmin(distancias))
+            if distancias[k] <= max_distancia:
+                resultado[j] = self.__tramo[segmentos[k]]
+        return resultado
+
+    def iplu_por_tramo(self, df, max_distancia=30):
+        """Agrega el IPLU de los resultados por tramo de calle: puntos, IPLU medio y máximo y prioridad.
+
+        Cada fila se asigna al tramo más cercano, así que sirve también para resultados de la malla cuadrada.
+        """
+        columnas = ["Tramo", "Via", "Nombre", "Tipo", "Longitud", "Latitude", "Longitude", "Puntos",
+                    "IPLU", "IPLU_max", "Prioridad"]
+        if df is None or not len(df) or not len(self.tramos):
+            return pd.DataFrame(columns=columnas)
+        if "IPLU" not in df:
+            df = agregar_iplu(df)
+        tramos = self.tramo_mas_cercano(df[["Latitude", "Longitude"]].to_numpy(dtype=float), max_distancia)
+        asignados = df.assign(_tramo=tramos)[tramos >= 0]
+        resumen = asignados.groupby("_tramo")["IPLU"].agg(Puntos="count", IPLU="mean", IPLU_max="max").reset_index()
+        resumen = resumen.join(self.tramos, on="_tramo")
+        medios = self.__geografica(np.array([self.__geometrias[t][len(self.__geometrias[t]) // 2]
+                                             for t in resumen["_tramo"]]).reshape(-1, 2))
+        resumen["Latitude"], resumen["Longitude"] = medios[:, 0], medios[:, 1]
+        resumen["IPLU"] = resumen["IPLU"].round(2)
+        resumen["Prioridad"] = bandas_prioridad(resumen["IPLU"])
+        return resumen.sort_values("IPLU", ascending=False)[columnas].reset_index(drop=True)
+
+    def stats(self):
+        return {"path": self.path, "tramos": len(self.tramos), "segmentos": len(self.__tramo),
+                "longitud_km": round(float(self.tramos["Longitud"].sum()) / 1000, 1) if len(self.tramos) else 0.0}
+
+
+if __name__ == "__main__":
+    # Revisión del extracto: python osm_helper.py medellin.osm [latitud longitud distancia step]
+    red = RedVial.cargar(sys.argv[1] if len(sys.argv) > 1 else None)
+    print(red.stats())
+    if len(sys.argv) > 5:
+        puntos, _ = red.puntos_en_calles(*map(float, sys.argv[2:6]))
+        print(f"{len(puntos)} puntos sobre calles")
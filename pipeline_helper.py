@@ -0,0 +1,248 @@
+import contextvars
+import queue
+import threading
+import time
+from metrics_helper import METRICS
+
+
+def _put(target, item, stop):
+    """Pone `item` en la cola sin quedar bloqueado para siempre: devuelve False si el pipeline se detuvo."""
+    while not stop.is_set():
+        try:
+            target.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+class RateLimiter():
+    """Limita la cantidad de llamadas por segundo compartida entre varios hilos."""
+
+    def __init__(self, rate):
+        self.__interval = 1.0 / rate if rate else 0.0
+        self.__next_slot = 0.0
+        self.__lock = threading.Lock()
+
+    def wait(self):
+        """Bloquea hasta que haya un turno disponible."""
+        if not self.__interval:
+            return
+        with self.__lock:
+            now = time.monotonic()
+            slot = max(now, self.__next_slot)
+            self.__next_slot = slot + self.__interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Stage():
+    """Etapa del pipeline con su propio pool de hilos y una cola de entrada acotada.
+
+    Si `batch_size` está definido, `func` recibe una lista de elementos y devuelve una lista con los
+    resultados en el mismo orden; si no, recibe y devuelve un único elemento.
+    """
+
+    def __init__(self, name, func, workers=1, queue_size=32, batch_size=None, max_wait=0.05, rate=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self.input = queue.Queue(maxsize=queue_size)
+        self.output = None
+        self.__rate_limiter = RateLimiter(rate) if rate else None
+        self.__lock = threading.Lock()
+        self.__alive = 0
+        self.processed = 0
+        self.errors = 0
+        self.batches = 0
+        self.busy_seconds = 0.0
+        self.blocked_seconds = 0.0
+        self.max_queue_depth = 0
+        self.__latencies = []
+
+    def start(self, output, stop=None):
+        self.output = output
+        self.__stop = stop or threading.Event()
+        self.__alive = self.workers
+        self.__started = time.monotonic()
+        # Cada hilo hereda el contexto de quien arranca el pipeline (p. ej. el registro de métricas de la ejecución)
+        threads = [threading.Thread(target=contextvars.copy_context().run, args=(self.__run,), name=f"{self.name}-{i}",
+                                    daemon=True) for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        return threads
+
+    def __take(self):
+        """Toma el siguiente elemento o lote de la cola. Devuelve (elementos, fin)."""
+        while True:
+            try:
+                item = self.input.get(timeout=0.5)
+                break
+            except queue.Empty:
+                if self.__stop.is_set():
+                    return [], True
+        depth = self.input.qsize() + 1
+        self.max_queue_depth = max(self.max_queue_depth, depth)
+        METRICS.set_gauge("basuras_queue_depth", depth - 1, stage=self.name)
+        if item is Pipeline.END:
+            return [], True
+        if not self.batch_size:
+            return [item], False
+
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                item = self.input.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if item is Pipeline.END:
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def __process(self, items):
+        if self.__rate_limiter:
+            self.__rate_limiter.wait()
+        start = time.monotonic()
+        try:
+            if self.batch_size:
+                results = self.func(items)
+            else:
+                results = [self.func(items[0])]
+        except Exception as e:
+            print(f"Error en la etapa {self.name}: {e}")
+            results = items
+            with self.__lock:
+                self.errors += len(items)
+        elapsed = time.monotonic() - start
+        with self.__lock:
+            self.busy_seconds += elapsed
+            self.__latencies.append(elapsed)
+            self.processed += len(items)
+            self.batches += 1
+        return results
+
+    def __put(self, item):
+        start = time.monotonic()
+        delivered = _put(self.output, item, self.__stop)
+        waited = time.monotonic() - start
+        if waited > 0.001:
+            with self.__lock:
+                self.blocked_seconds += waited
+        return delivered
+
+    def __run(self):
+        ended = False
+        while not ended:
+            items, ended = self.__take()
+            # Detenido por el consumidor: no se inician llamadas nuevas ni se propaga el fin
+            if self.__stop.is_set():
+                return
+            if items:
+                for result in self.__process(items):
+                    if not self.__put(result):
+                        return
+        # El último hilo en terminar propaga el fin a la siguiente etapa
+        with self.__lock:
+            self.__alive -= 1
+            last = self.__alive == 0
+        if last:
+            self.output.put(Pipeline.END)
+        else:
+            self.input.put(Pipeline.END)
+
+    def percentile(self, q):
+        """Latencia (segundos) de una llamada a `func` en el percentil `q` (0-100)."""
+        with self.__lock:
+            latencies = sorted(self.__latencies)
+        if not latencies:
+            return 0.0
+        return latencies[min(len(latencies) - 1, int(round(q / 100 * (len(latencies) - 1))))]
+
+    def stats(self):
+        """Resumen de carga de la etapa: utilización alta = cuello de botella, bloqueo alto = etapa siguiente saturada."""
+        elapsed = max(time.monotonic() - self.__started, 1e-9)
+        return {
+            "stage": self.name,
+            "workers": self.workers,
+            "processed": self.processed,
+            "errors": self.errors,
+            "batches": self.batches,
+            "queue_depth": self.input.qsize(),
+            "max_queue_depth": self.max_queue_depth,
+            "queue_size": self.input.maxsize,
+            "utilization": round(self.busy_seconds / (self.workers * elapsed), 3),
+            "blocked_seconds": round(self.blocked_seconds, 3),
+            "p50_ms": round(self.percentile(50) * 1000, 1),
+            "p95_ms": round(self.percentile(95) * 1000, 1),
+            "p99_ms": round(self.percentile(99) * 1000, 1),
+        }
+
+
+class Pipeline():
+    """Encadena etapas mediante colas acotadas; la presión hacia atrás mantiene la memoria estable."""
+    END = object()
+
+    def __init__(self, stages, output_size=32):
+        self.stages = stages
+        self.output = queue.Queue(maxsize=output_size)
+        self.__stop = threading.Event()
+
+    def run(self, items):
+        """Procesa los elementos y los entrega a medida que salen de la última etapa.
+
+        Si el consumidor abandona el generador antes del final, se detienen las etapas y el hilo que las
+        alimenta, y se vacían las colas para liberar los elementos en tránsito.
+        """
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.start(next_stage.input, self.__stop)
+        self.stages[-1].start(self.output, self.__stop)
+
+        def feed():
+            for item in items:
+                if not _put(self.stages[0].input, item, self.__stop):
+                    return
+            _put(self.stages[0].input, Pipeline.END, self.__stop)
+
+        threading.Thread(target=feed, name="pipeline-feed", daemon=True).start()
+
+        finished = False
+        try:
+            while True:
+                item = self.output.get()
+                if item is Pipeline.END:
+                    finished = True
+                    break
+                yield item
+        finally:
+            if not finished:
+                self.stop()
+
+    def stop(self):
+        """Detiene el pipeline: vacía las colas y despierta a los hilos que esperan elementos."""
+        self.__stop.set()
+        for target in [stage.input for stage in self.stages] + [self.output]:
+            self.__drain(target)
+        for stage in self.stages:
+            for _ in range(stage.workers):
+                try:
+                    stage.input.put_nowait(Pipeline.END)
+                except queue.Full:
+                    break
+
+    @staticmethod
+    def __drain(target):
+        while True:
+            try:
+                target.get_nowait()
+            except queue.Empty:
+                return
+
+    def stats(self):
+        return [stage.stats() for stage in self.stages]
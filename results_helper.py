@@ -0,0 +1,190 @@
+import os
+import glob
+import json
+import socket
+import time
+import pandas as pd
+
+COLUMNS = ["Latitude", "Longitude", "Image", "Label", "Description", "PanoId"]
+
+# Esquema tipado de los resultados: la columna Description se aplana una sola vez al construir el DataFrame
+CATEGORIAS = {
+    "acumulacion_basura": ["Sí", "No"],
+    "intensidad_basura": ["No Aplica", "Leve", "Moderada", "Alta"],
+    "recoleccion_urgente": ["No urgente", "Moderadamente urgente", "Urgente"],
+    "papeleras_presentes": ["Sí", "No"],
+}
+ASSESSMENT_COLUMNS = ["es_imagen_valida", "limpieza_general", "acumulacion_basura", "intensidad_basura",
+                      "recoleccion_urgente", "papeleras_presentes", "justificacion"]
+RESULT_COLUMNS = ["Latitude", "Longitude", "Image", "Label", "PanoId"] + ASSESSMENT_COLUMNS
+
+
+def point_key(latitude, longitude):
+    """Llave con la que se identifica un punto de la malla entre ejecuciones."""
+    return f"{latitude:.6f},{longitude:.6f}"
+
+
+def fila_completa(row):
+    """Indica si una fila registrada tiene imagen, clasificación y evaluación; las demás se reprocesan al reanudar."""
+    return row[2] != "ERROR" and row[3] != "ERROR" and isinstance(row[4], dict)
+
+
+def _categoria(serie, categorias):
+    """Convierte a categoría con valores canónicos; la comparación ignora mayúsculas (p. ej. "Moderadamente Urgente")."""
+    canonicos = {categoria.lower(): categoria for categoria in categorias}
+    canonicos.update({"no": categorias[0]} if "No Aplica" in categorias else {})
+    canonicos.update({"si": "Sí"} if "Sí" in categorias else {})
+    valores = serie.astype("string").str.strip().str.lower().map(canonicos)
+    return pd.Categorical(valores, categories=categorias)
+
+
+_BOOLEANOS = {"true": True, "verdadero": True, "sí": True, "si": True, "yes": True, "1": True,
+              "false": False, "falso": False, "no": False, "0": False}
+
+
+def _booleano(serie):
+    """Convierte a booleano tolerando respuestas como "true" o "Sí"; lo que no se reconoce queda como <NA>."""
+    valores = [valor if isinstance(valor, bool) else _BOOLEANOS.get(str(valor).strip().lower()) if valor is not None else None
+               for valor in serie]
+    return pd.array(valores, dtype="boolean")
+
+
+def construir_resultados(rows):
+    """Construye el DataFrame tipado de resultados a partir de las filas [Latitude, ..., Description, PanoId]."""
+    base = pd.DataFrame(rows, columns=COLUMNS)
+    descripciones = [description if isinstance(description, dict) else {} for description in base["Description"]]
+    evaluaciones = pd.DataFrame.from_records(descripciones, columns=ASSESSMENT_COLUMNS, index=base.index)
+
+    df = pd.concat([base.drop(columns=["Description"]), evaluaciones], axis=1)
+    df = df.astype({"Latitude": "float64", "Longitude": "float64", "Image": "string", "PanoId": "string",
+                    "Label": "category", "justificacion": "string"})
+    df["es_imagen_valida"] = _booleano(df["es_imagen_valida"])
+    df["limpieza_general"] = pd.to_numeric(df["limpieza_general"], errors="coerce")
+    for columna, categorias in CATEGORIAS.items():
+        df[columna] = _categoria(df[columna], categorias)
+    return df[RESULT_COLUMNS]
+
+
+class ResultLog():
+    """Registro append-only (JSONL) de las filas completadas, con fsync por lotes.
+
+    Cada fila se escribe apenas termina; el fsync se hace cada `flush_every` filas o `flush_interval`
+    segundos, de modo que un fallo pierde como mucho ese último tramo.
+    """
+
+    def __init__(self, path, flush_every=20, flush_interval=2.0):
+        self.path = path
+        self.flush_every = flush_every
+        self.flush_interval = flush_interval
+        self.__pending = 0
+        self.__last_sync = time.monotonic()
+        needs_newline = os.path.exists(path) and os.path.getsize(path) > 0 and not self.__ends_with_newline(path)
+        self.__file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            # Una línea truncada por un fallo previo no debe pegarse a la siguiente
+            self.__file.write("\n")
+
+    @staticmethod
+    def __ends_with_newline(path):
+        with open(path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b"\n"
+
+    @staticmethod
+    def read(path):
+        """Lee las filas registradas, ignorando una posible última línea incompleta."""
+        rows = []
+        if not os.path.exists(path):
+            return rows
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                rows.append([record.get(column) for column in COLUMNS])
+        return rows
+
+    def append(self, row):
+        self.__file.write(json.dumps(dict(zip(COLUMNS, row)), ensure_ascii=False) + "\n")
+        self.__pending += 1
+        if self.__pending >= self.flush_every or time.monotonic() - self.__last_sync >= self.flush_interval:
+            self.sync()
+
+    def sync(self):
+        self.__file.flush()
+        os.fsync(self.__file.fileno())
+        self.__pending = 0
+        self.__last_sync = time.monotonic()
+
+    def close(self):
+        self.sync()
+        self.__file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RunManifest():
+    """Describe una ejecución (parámetros y estado) para poder reanudarla."""
+    FILE_NAME = "run.json"
+
+    def __init__(self, folder, params):
+        self.folder = folder
+        self.params = params
+        self.path = os.path.join(folder, self.FILE_NAME)
+
+    def write(self, status):
+        data = {"params": self.params, "status": status, "updated": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "pid": os.getpid(), "host": socket.gethostname()}
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def in_progress(data):
+        """Indica si la ejecución del manifiesto sigue en curso en otro proceso vivo (no si quedó interrumpida)."""
+        if data.get("status") != "running" or not data.get("pid"):
+            return False
+        if data.get("host") != socket.gethostname():
+            # No se puede comprobar un proceso de otra máquina: se asume en curso
+            return True
+        if data["pid"] == os.getpid():
+            return True
+        if os.name == "nt":
+            # En Windows os.kill(pid, 0) terminaría el proceso
+            return False
+        try:
+            os.kill(data["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            return True
+        return True
+
+    @classmethod
+    def find_previous(cls, pattern, params, exclude=()):
+        """Busca la carpeta más reciente que coincida con `pattern`, se haya lanzado con los mismos parámetros y
+        haya quedado a medias: interrumpida, o "running" de un proceso que ya no existe.
+
+        Las ejecuciones completadas no se reanudan (una nueva ejecución debe tomar datos nuevos) y se omiten
+        las carpetas de `exclude` y las de ejecuciones que siguen en curso en otro proceso.
+        """
+        for folder in sorted(glob.glob(pattern), reverse=True):
+            if folder in exclude:
+                continue
+            try:
+                with open(os.path.join(folder, cls.FILE_NAME), encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                continue
+            if data.get("params") != params:
+                continue
+            status = data.get("status")
+            if status == "interrupted" or (status == "running" and not cls.in_progress(data)):
+                return folder
+        return None
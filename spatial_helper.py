@@ -0,0 +1,202 @@
+import os
+import sys
+import json
+import sqlite3
+import threading
+import time
+import numpy as np
+import pandas as pd
+from dotenv import load_dotenv
+
+from geo_helper import radios_locales, distancia_metros
+from results_helper import ResultLog, construir_resultados
+
+load_dotenv()
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+
+def geohash(latitud, longitud, precision=9):
+    """Codifica una coordenada como geohash (precisión 9 ≈ celdas de 5 m x 5 m)."""
+    lat_min, lat_max, lon_min, lon_max = -90.0, 90.0, -180.0, 180.0
+    bits, bit, even, code = 0, 0, True, []
+    while len(code) < precision:
+        if even:
+            middle = (lon_min + lon_max) / 2
+            if longitud >= middle:
+                bits, lon_min = bits * 2 + 1, middle
+            else:
+                bits, lon_max = bits * 2, middle
+        else:
+            middle = (lat_min + lat_max) / 2
+            if latitud >= middle:
+                bits, lat_min = bits * 2 + 1, middle
+            else:
+                bits, lat_max = bits * 2, middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            code.append(_BASE32[bits])
+            bits, bit = 0, 0
+    return "".join(code)
+
+
+class AssessmentStore():
+    """Almacén espacial persistente de todas las evaluaciones de puntos, con la fecha de cada una.
+
+    Las filas se indexan por latitud/longitud (consultas por rectángulo y radio) y por geohash (agregación
+    por celdas). `reutilizables` busca, para cada punto de una malla nueva, una evaluación reciente a menos
+    de `tolerancia` metros, de modo que las zonas ya recorridas no se vuelven a pedir a las APIs.
+    """
+    __STORE_DIR = os.getenv("ASSESSMENT_STORE_DIR", "./.cache/assessments")
+    __GEOHASH_PRECISION = 9
+
+    def __init__(self, store_dir=None):
+        self.store_dir = store_dir or self.__STORE_DIR
+        self.__lock = threading.Lock()
+        os.makedirs(self.store_dir, exist_ok=True)
+        self.__conn = sqlite3.connect(os.path.join(self.store_dir, "store.sqlite"), timeout=30, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS points ("
+            "id INTEGER PRIMARY KEY, geohash TEXT NOT NULL, lat REAL NOT NULL, lon REAL NOT NULL, "
+            "image TEXT, label TEXT, description TEXT NOT NULL, pano_id TEXT, created REAL NOT NULL)"
+        )
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS points_lat_lon ON points(lat, lon)")
+        self.__conn.execute("CREATE INDEX IF NOT EXISTS points_geohash ON points(geohash)")
+        self.__conn.commit()
+
+    def agregar(self, rows, created=None):
+        """Guarda filas [Latitude, Longitude, Image, Label, Description, PanoId] con evaluación válida."""
+        created = created or time.time()
+        values = [
+            (geohash(lat, lon, self.__GEOHASH_PRECISION), lat, lon, image, label,
+             json.dumps(description, ensure_ascii=False), pano_id, created)
+            for lat, lon, image, label, description, pano_id in rows
+            if image != "ERROR" and isinstance(description, dict)
+        ]
+        if values:
+            with self.__lock:
+                self.__conn.executemany(
+                    "INSERT INTO points (geohash, lat, lon, image, label, description, pano_id, created) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", values)
+                self.__conn.commit()
+        return len(values)
+
+    def __select(self, lat_min, lat_max, lon_min, lon_max, desde=None):
+        query = ("SELECT lat, lon, image, label, description, pano_id, created FROM points "
+                 "WHERE lat BETWEEN ? AND ? AND lon BETWEEN ? AND ?")
+        params = [lat_min, lat_max, lon_min, lon_max]
+        if desde is not None:
+            query += " AND created >= ?"
+            params.append(desde)
+        with self.__lock:
+            return self.__conn.execute(query, params).fetchall()
+
+    @staticmethod
+    def __to_frame(records):
+        df = construir_resultados([[lat, lon, image, label, json.loads(description), pano_id]
+                                   for lat, lon, image, label, description, pano_id, _ in records])
+        df["Fecha"] = pd.to_datetime([record[6] for record in records], unit="s")
+        return df
+
+    def en_rectangulo(self, lat_min, lon_min, lat_max, lon_max, desde=None):
+        """Evaluaciones dentro del rectángulo, opcionalmente solo las posteriores a `desde` (epoch)."""
+        return self.__to_frame(self.__select(lat_min, lat_max, lon_min, lon_max, desde))
+
+    def en_radio(self, latitud, longitud, radio, desde=None):
+        """Evaluaciones a menos de `radio` metros del punto."""
+        radio_meridiano, radio_paralelo = radios_locales(latitud)
+        delta_lat, delta_lon = np.degrees(radio / radio_meridiano), np.degrees(radio / radio_paralelo)
+        records = self.__select(latitud - delta_lat, latitud + delta_lat, longitud - delta_lon, longitud + delta_lon, desde)
+        if records:
+            coords = np.array([record[:2] for record in records])
+            dentro = distancia_metros(coords[:, 0], coords[:, 1], (latitud, longitud)) <= radio
+            records = [record for record, ok in zip(records, dentro) if ok]
+        return self.__to_frame(records)
+
+    def por_celda(self, precision=7, desde=None):
+        """Cantidad de evaluaciones y fecha de la más reciente por celda geohash (precisión 7 ≈ 150 m)."""
+        query = "SELECT substr(geohash, 1, ?) AS celda, COUNT(*), MAX(created) FROM points"
+        params = [precision]
+        if desde is not None:
+            query += " WHERE created >= ?"
+            params.append(desde)
+        with self.__lock:
+            records = self.__conn.execute(query + " GROUP BY celda", params).fetchall()
+        return pd.DataFrame(records, columns=["Celda", "Evaluaciones", "Ultima"])
+
+    def __nearest(self, points, tolerancia, desde=None):
+        """Para cada punto (array N x 2), la evaluación más cercana a menos de `tolerancia` metros posterior
+        a `desde`. Devuelve {índice del punto: registro}."""
+        if not len(points) or tolerancia <= 0:
+            return {}
+        centro = points.mean(axis=0)
+        radio_meridiano, radio_paralelo = radios_locales(centro[0])
+        delta_lat, delta_lon = np.degrees(tolerancia / radio_meridiano), np.degrees(tolerancia / radio_paralelo)
+        records = self.__select(points[:, 0].min() - delta_lat, points[:, 0].max() + delta_lat,
+                                points[:, 1].min() - delta_lon, points[:, 1].max() + delta_lon, desde)
+        if not records:
+            return {}
+
+        # Rejilla de celdas de `tolerancia` metros: cada punto solo se compara con las 9 celdas vecinas
+        def celdas(lats, lons):
+            norte = np.radians(lats - centro[0]) * radio_meridiano
+            este = np.radians(lons - centro[1]) * radio_paralelo
+            return norte, este, np.floor(norte / tolerancia).astype(int), np.floor(este / tolerancia).astype(int)
+
+        coords = np.array([record[:2] for record in records])
+        norte_r, este_r, fila_r, columna_r = celdas(coords[:, 0], coords[:, 1])
+        rejilla = {}
+        for i, celda in enumerate(zip(fila_r.tolist(), columna_r.tolist())):
+            rejilla.setdefault(celda, []).append(i)
+
+        cercanas = {}
+        norte_p, este_p, fila_p, columna_p = celdas(points[:, 0], points[:, 1])
+        for j in range(len(points)):
+            mejor, mejor_clave = None, None
+            for dn in (-1, 0, 1):
+                for dc in (-1, 0, 1):
+                    for i in rejilla.get((fila_p[j] + dn, columna_p[j] + dc), ()):
+                        distancia = np.hypot(norte_r[i] - norte_p[j], este_r[i] - este_p[j])
+                        # Ante la misma distancia se prefiere la evaluación más reciente
+                        clave = (distancia, -records[i][6])
+                        if distancia <= tolerancia and (mejor_clave is None or clave < mejor_clave):
+                            mejor, mejor_clave = i, clave
+            if mejor is not None:
+                cercanas[j] = records[mejor]
+        return cercanas
+
+    def reutilizables(self, points, tolerancia, max_edad):
+        """Para cada punto (array N x 2) busca la evaluación más cercana a menos de `tolerancia` metros y
+        con menos de `max_edad` segundos. Devuelve {índice del punto: fila} con la coordenada del punto."""
+        if max_edad <= 0:
+            return {}
+        return {
+            j: [float(points[j, 0]), float(points[j, 1]), image, label, json.loads(description), pano_id]
+            for j, (_, _, image, label, description, pano_id, _) in self.__nearest(points, tolerancia, time.time() - max_edad).items()
+        }
+
+    def ultima_evaluacion(self, points, tolerancia):
+        """Fecha (epoch) de la evaluación más cercana de cada punto, o NaN si nunca se ha evaluado."""
+        fechas = np.full(len(points), np.nan)
+        for j, record in self.__nearest(points, tolerancia).items():
+            fechas[j] = record[6]
+        return fechas
+
+    def importar_log(self, path):
+        """Carga en el almacén un registro JSONL de una ejecución anterior, fechado con su última modificación."""
+        return self.agregar(ResultLog.read(path), created=os.path.getmtime(path))
+
+    def stats(self):
+        with self.__lock:
+            entries, oldest, newest = self.__conn.execute("SELECT COUNT(*), MIN(created), MAX(created) FROM points").fetchone()
+        return {"entries": entries, "oldest": oldest, "newest": newest}
+
+
+if __name__ == "__main__":
+    # Carga histórica: python spatial_helper.py ./LT*_T*/*.jsonl
+    store = AssessmentStore()
+    for path in sys.argv[1:]:
+        print(f"{path}: {store.importar_log(path)} evaluaciones importadas")
+    print(store.stats())
@@ -0,0 +1,200 @@
+import os
+import mmap
+import sqlite3
+import threading
+from io import BytesIO
+from urllib.request import pathname2url
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+class PanoramaArchive():
+    """Archivo empaquetado con las panorámicas de una ejecución: un único blob y un índice SQLite.
+
+    Cada panorámica se guarda en un formato compacto (WebP por defecto) junto con una miniatura generada al
+    ingresarla. Las lecturas usan un mapa de memoria del blob en lugar de abrir miles de archivos pequeños.
+    Los datos se escriben antes que la entrada del índice, así que un fallo nunca deja entradas a medias.
+    """
+    FILE_NAME = "panoramas.pack"
+    INDEX_NAME = "panoramas.sqlite"
+    __FORMAT = os.getenv("PANORAMA_FORMAT", "WEBP").upper()
+    __QUALITY = int(os.getenv("PANORAMA_QUALITY", "70"))
+    __THUMB_WIDTH = int(os.getenv("PANORAMA_THUMB_WIDTH", "480"))
+    __THUMB_QUALITY = int(os.getenv("PANORAMA_THUMB_QUALITY", "60"))
+    __archives = {}
+    __archives_lock = threading.Lock()
+
+    def __init__(self, folder, image_format=None, quality=None, thumb_width=None):
+        self.folder = folder
+        self.format = (image_format or self.__FORMAT).upper()
+        self.quality = quality or self.__QUALITY
+        self.thumb_width = thumb_width or self.__THUMB_WIDTH
+        self.__lock = threading.Lock()
+        self.__mmap = None
+
+        os.makedirs(folder, exist_ok=True)
+        self.__file = open(os.path.join(folder, self.FILE_NAME), "a+b")
+        self.__conn = sqlite3.connect(os.path.join(folder, self.INDEX_NAME), timeout=30, check_same_thread=False)
+        self.__conn.execute("PRAGMA journal_mode=WAL")
+        self.__conn.execute(
+            "CREATE TABLE IF NOT EXISTS panoramas ("
+            "key TEXT PRIMARY KEY, offset INTEGER NOT NULL, length INTEGER NOT NULL, "
+            "thumb_offset INTEGER NOT NULL, thumb_length INTEGER NOT NULL, format TEXT NOT NULL, "
+            "width INTEGER NOT NULL, height INTEGER NOT NULL)"
+        )
+        self.__conn.commit()
+
+    @classmethod
+    def open(cls, folder):
+        """Devuelve el archivo de la carpeta para escribir en ella; se comparte entre hilos hasta `release`."""
+        folder = os.path.normpath(folder)
+        with cls.__archives_lock:
+            archive = cls.__archives.get(folder)
+            if archive is None:
+                archive = cls.__archives[folder] = cls(folder)
+            return archive
+
+    @classmethod
+    def release(cls, folder):
+        with cls.__archives_lock:
+            archive = cls.__archives.pop(os.path.normpath(folder), None)
+        if archive is not None:
+            archive.close()
+
+    @classmethod
+    def read(cls, folder, key, thumbnail=False):
+        """Lee una panorámica sin dejar el archivo abierto.
+
+        Si la carpeta pertenece a una ejecución en curso se usa su archivo compartido; en otro caso se abren el
+        blob y el índice (solo lectura) durante la llamada y se cierran al terminar.
+        """
+        folder = os.path.normpath(folder)
+        with cls.__archives_lock:
+            archive = cls.__archives.get(folder)
+        if archive is not None:
+            try:
+                return archive.get(key, thumbnail)
+            except (sqlite3.ProgrammingError, ValueError):
+                pass  # la ejecución terminó y liberó el archivo entre medio
+        uri = f"file:{pathname2url(os.path.abspath(os.path.join(folder, cls.INDEX_NAME)))}?mode=ro"
+        conn = sqlite3.connect(uri, uri=True, timeout=30)
+        try:
+            row = conn.execute(
+                "SELECT offset, length, thumb_offset, thumb_length FROM panoramas WHERE key = ?", (key,)
+            ).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        offset, length = (row[2], row[3]) if thumbnail else (row[0], row[1])
+        with open(os.path.join(folder, cls.FILE_NAME), "rb") as f:
+            f.seek(offset)
+            return f.read(length)
+
+    @classmethod
+    def exists(cls, folder):
+        return os.path.exists(os.path.join(folder, cls.INDEX_NAME))
+
+    @staticmethod
+    def __encode(image, image_format, quality):
+        buffer = BytesIO()
+        image.save(buffer, format=image_format, quality=quality)
+        return buffer.getvalue()
+
+    def put(self, key, image, jpeg=None):
+        """Guarda la panorámica (imagen PIL) y su miniatura. Con formato JPEG se reutiliza `jpeg` si se pasa."""
+        if self.format == "JPEG" and jpeg is not None:
+            content = jpeg
+        else:
+            content = self.__encode(image, self.format, self.quality)
+        thumb_height = max(1, round(image.height * self.thumb_width / image.width))
+        thumbnail = self.__encode(image.resize((self.thumb_width, thumb_height)), self.format, self.__THUMB_QUALITY)
+
+        with self.__lock:
+            self.__file.seek(0, os.SEEK_END)
+            offset = self.__file.tell()
+            self.__file.write(content)
+            self.__file.write(thumbnail)
+            self.__file.flush()
+            self.__conn.execute(
+                "INSERT OR REPLACE INTO panoramas (key, offset, length, thumb_offset, thumb_length, format, width, height) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, offset, len(content), offset + len(content), len(thumbnail), self.format, image.width, image.height)
+            )
+            self.__conn.commit()
+        return len(content) + len(thumbnail)
+
+    def get(self, key, thumbnail=False):
+        """Devuelve los bytes de la panorámica (o de su miniatura) o None si no existe."""
+        with self.__lock:
+            row = self.__conn.execute(
+                "SELECT offset, length, thumb_offset, thumb_length FROM panoramas WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            offset, length = (row[2], row[3]) if thumbnail else (row[0], row[1])
+            # El blob crece mientras la ejecución avanza: se vuelve a mapear solo si la entrada queda fuera
+            if self.__mmap is None or offset + length > len(self.__mmap):
+                if self.__mmap is not None:
+                    self.__mmap.close()
+                self.__mmap = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            return bytes(self.__mmap[offset:offset + length])
+
+    def stats(self):
+        with self.__lock:
+            entries, size = self.__conn.execute("SELECT COUNT(*), COALESCE(SUM(length + thumb_length), 0) FROM panoramas").fetchone()
+        return {"entries": entries, "bytes": size, "format": self.format}
+
+    def close(self):
+        with self.__lock:
+            if self.__mmap is not None:
+                self.__mmap.close()
+                self.__mmap = None
+            self.__file.close()
+            self.__conn.close()
+
+
+def archive_ref(folder, key):
+    """Referencia de una panorámica empaquetada, tal como se guarda en la columna Image."""
+    return f"{os.path.join(folder, PanoramaArchive.FILE_NAME)}#{key}"
+
+
+def parse_ref(ref):
+    """Devuelve (carpeta, llave) si `ref` apunta a un archivo empaquetado, o None si es una ruta normal."""
+    path, separator, key = str(ref).rpartition("#")
+    if not separator or os.path.basename(path) != PanoramaArchive.FILE_NAME:
+        return None
+    return os.path.dirname(path), key
+
+
+def image_name(ref):
+    """Nombre corto de la imagen: la llave en el archivo empaquetado o el nombre del archivo."""
+    parsed = parse_ref(ref)
+    return parsed[1] if parsed else os.path.basename(str(ref))
+
+
+def read_image(ref, thumbnail=False):
+    """Lee una imagen a partir del valor de la columna Image (archivo empaquetado o ruta a un JPEG)."""
+    parsed = parse_ref(ref)
+    if parsed is None:
+        # Ejecuciones anteriores: un JPEG por punto, sin miniatura
+        try:
+            with open(ref, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+    folder, key = parsed
+    if not PanoramaArchive.exists(folder):
+        return None
+    return PanoramaArchive.read(folder, key, thumbnail)
+
+
+def image_mime(content):
+    if content[:4] == b"RIFF" and content[8:12] == b"WEBP":
+        return "image/webp"
+    if content[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if content[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return "application/octet-stream"
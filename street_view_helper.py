@@ -0,0 +1,207 @@
+import os
+import asyncio
+import random
+import threading
+import time
+import concurrent.futures
+import httpx
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from metrics_helper import METRICS
+
+load_dotenv()
+
+
+class StreetViewMetadata():
+    """Cliente del endpoint de metadatos de Street View (gratuito, no consume cuota de imágenes)."""
+    __API_KEY = os.getenv("API_KEY_STREET_VIEW")
+    __BASE_URL = os.getenv("STREET_VIEW_BASE_URL", "https://maps.googleapis.com/maps/api/streetview")
+    __NO_COVERAGE = ("ZERO_RESULTS", "NOT_FOUND")
+
+    def __init__(self, base_url=None, api_key=None, timeout=10, max_workers=16):
+        self.base_url = (base_url or self.__BASE_URL).rstrip("/")
+        self.api_key = api_key or self.__API_KEY
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.__session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.__session.mount("http://", adapter)
+        self.__session.mount("https://", adapter)
+
+    def get_metadata(self, location):
+        """Consulta los metadatos de la panorámica más cercana a una coordenada "lat,lon"."""
+        response = self.__session.get(
+            f"{self.base_url}/metadata",
+            params={"location": location, "key": self.api_key},
+            timeout=self.timeout
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def resolve_panoramas(self, locations):
+        """Agrupa las coordenadas por panorámica.
+
+        Devuelve un diccionario {clave: {"pano_id", "location", "points"}} donde "points" son los
+        índices de `locations` que apuntan a la misma panorámica, y la lista de índices sin cobertura.
+        Si la consulta de una coordenada falla, ésta se conserva como un grupo propio (sin pano_id).
+        """
+        groups = {}
+        no_coverage = []
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self.get_metadata, location): i for i, location in enumerate(locations)}
+            results = {}
+            for future in concurrent.futures.as_completed(futures):
+                i = futures[future]
+                try:
+                    results[i] = future.result()
+                except Exception as e:
+                    print(f"Error al consultar los metadatos de {locations[i]}: {e}")
+                    results[i] = None
+
+        for i, location in enumerate(locations):
+            metadata = results[i]
+            if metadata is None or metadata.get("status") not in ("OK",) + self.__NO_COVERAGE:
+                groups[location] = {"pano_id": None, "location": location, "points": [i]}
+                continue
+            if metadata["status"] != "OK":
+                no_coverage.append(i)
+                continue
+
+            pano_id = metadata["pano_id"]
+            if pano_id not in groups:
+                pano_location = metadata.get("location")
+                if pano_location:
+                    pano_location = "{:06f},{:06f}".format(pano_location["lat"], pano_location["lng"])
+                else:
+                    pano_location = location
+                groups[pano_id] = {"pano_id": pano_id, "location": pano_location, "points": []}
+            groups[pano_id]["points"].append(i)
+
+        return groups, no_coverage
+
+
+class StreetViewFetcher():
+    """Motor asíncrono de descarga para la API Static de Street View.
+
+    Mantiene un único cliente HTTP con conexiones reutilizables sobre un event loop propio, de modo que
+    los hilos de `Basuras` comparten el mismo pool, el mismo límite de peticiones por segundo y el mismo
+    máximo de peticiones en vuelo. Los reintentos usan backoff exponencial con jitter.
+    """
+    __API_KEY = os.getenv("API_KEY_STREET_VIEW")
+    __BASE_URL = os.getenv("STREET_VIEW_BASE_URL", "https://maps.googleapis.com/maps/api/streetview")
+    __REQUESTS_PER_SECOND = float(os.getenv("STREET_VIEW_RPS", "25"))
+    __MAX_IN_FLIGHT = int(os.getenv("STREET_VIEW_MAX_IN_FLIGHT", "32"))
+    __MAX_RETRIES = int(os.getenv("STREET_VIEW_MAX_RETRIES", "4"))
+    __RETRY_STATUS = (429, 500, 502, 503, 504)
+    __shared = None
+    __shared_lock = threading.Lock()
+
+    def __init__(self, base_url=None, api_key=None, requests_per_second=None, max_in_flight=None,
+                 max_retries=None, timeout=15, backoff_base=0.5, backoff_max=10):
+        self.base_url = (base_url or self.__BASE_URL).rstrip("/")
+        self.api_key = api_key or self.__API_KEY
+        self.requests_per_second = requests_per_second or self.__REQUESTS_PER_SECOND
+        self.max_in_flight = max_in_flight or self.__MAX_IN_FLIGHT
+        self.max_retries = max_retries if max_retries is not None else self.__MAX_RETRIES
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.stats = {"requests": 0, "retries": 0, "failures": 0, "bytes": 0}
+
+        self.__interval = 1.0 / self.requests_per_second if self.requests_per_second > 0 else 0.0
+        self.__next_slot = 0.0
+        self.__loop = asyncio.new_event_loop()
+        self.__thread = threading.Thread(target=self.__loop.run_forever, daemon=True)
+        self.__thread.start()
+        self.__call(self.__setup()).result()
+
+    @classmethod
+    def shared(cls):
+        """Devuelve la instancia compartida por todo el proceso."""
+        if cls.__shared is None:
+            with cls.__shared_lock:
+                if cls.__shared is None:
+                    cls.__shared = cls()
+        return cls.__shared
+
+    def __call(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.__loop)
+
+    async def __setup(self):
+        self.__semaphore = asyncio.Semaphore(self.max_in_flight)
+        self.__rate_lock = asyncio.Lock()
+        self.__client = httpx.AsyncClient(
+            timeout=self.timeout,
+            limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+        )
+
+    async def __wait_rate(self):
+        if not self.__interval:
+            return
+        async with self.__rate_lock:
+            now = time.monotonic()
+            slot = max(now, self.__next_slot)
+            self.__next_slot = slot + self.__interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+    def __backoff(self, attempt, response=None):
+        retry_after = response.headers.get("Retry-After") if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return float(retry_after)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    async def fetch(self, params):
+        """Descarga una imagen con reintentos. Devuelve el contenido o None si se agotan los intentos."""
+        params = dict(params, key=self.api_key)
+        for attempt in range(self.max_retries + 1):
+            response = None
+            await self.__wait_rate()
+            try:
+                async with self.__semaphore:
+                    self.stats["requests"] += 1
+                    start = time.perf_counter()
+                    try:
+                        response = await self.__client.get(self.base_url, params=params)
+                    finally:
+                        METRICS.observe("basuras_streetview_request_seconds", time.perf_counter() - start)
+                if response.status_code == 200:
+                    self.stats["bytes"] += len(response.content)
+                    METRICS.inc("basuras_streetview_requests_total", outcome="success")
+                    METRICS.inc("basuras_streetview_bytes_total", len(response.content))
+                    return response.content
+                if response.status_code not in self.__RETRY_STATUS:
+                    print(f"Error al obtener la imagen para {params.get('heading')}: {response.status_code}")
+                    break
+                error = response.status_code
+            except httpx.TransportError as e:
+                error = e
+            if attempt < self.max_retries:
+                self.stats["retries"] += 1
+                METRICS.inc("basuras_streetview_requests_total", outcome="retry")
+                await asyncio.sleep(self.__backoff(attempt, response))
+            else:
+                print(f"Error al obtener la imagen para {params.get('heading')} tras {attempt + 1} intentos: {error}")
+        self.stats["failures"] += 1
+        METRICS.inc("basuras_streetview_requests_total", outcome="failure")
+        return None
+
+    async def fetch_headings(self, location, headings, size, fov, pitch, pano_id=None):
+        """Descarga en paralelo las orientaciones de un punto. Devuelve {heading: contenido o None}."""
+        target = {"pano": pano_id} if pano_id else {"location": location}
+        contents = await asyncio.gather(*[
+            self.fetch(dict(target, size=size, heading=heading, fov=fov, pitch=pitch)) for heading in headings
+        ])
+        return dict(zip(headings, contents))
+
+    def get_images(self, location, headings, size, fov, pitch, pano_id=None):
+        """Versión síncrona de `fetch_headings`, segura para llamarse desde cualquier hilo."""
+        return self.__call(self.fetch_headings(location, headings, size, fov, pitch, pano_id)).result()
+
+    def close(self):
+        """Cierra el cliente HTTP y detiene el event loop."""
+        self.__call(self.__client.aclose()).result()
+        self.__loop.call_soon_threadsafe(self.__loop.stop)
+        self.__thread.join()
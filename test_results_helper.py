@@ -0,0 +1,97 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+
+import numpy as np
+import pytest
+
+from iplu_helper import calcular_iplu
+from results_helper import RunManifest, construir_resultados, fila_completa
+
+
+def evaluacion(**valores):
+    base = {"es_imagen_valida": True, "limpieza_general": 10, "acumulacion_basura": "No", "intensidad_basura": "No Aplica",
+            "recoleccion_urgente": "No urgente", "papeleras_presentes": "Sí", "justificacion": ""}
+    base.update(valores)
+    return base
+
+
+def fila(description):
+    return [6.25, -75.57, "img.jpg", "limpia", description, "pano"]
+
+
+def test_es_imagen_valida_tolera_cadenas():
+    df = construir_resultados([fila(evaluacion(es_imagen_valida=valor))
+                               for valor in (True, "true", "Sí", "no", "False", "quizás", None)])
+    assert df["es_imagen_valida"].isna().tolist() == [False] * 5 + [True] * 2
+    assert df["es_imagen_valida"].fillna(False).tolist() == [True, True, True, False, False, False, False]
+
+
+def test_categorias_ignoran_mayusculas():
+    df = construir_resultados([fila(evaluacion(intensidad_basura="leve", acumulacion_basura="sí",
+                                               recoleccion_urgente="Moderadamente Urgente", papeleras_presentes="NO"))])
+    assert df.loc[0, "intensidad_basura"] == "Leve"
+    assert df.loc[0, "acumulacion_basura"] == "Sí"
+    assert df.loc[0, "recoleccion_urgente"] == "Moderadamente urgente"
+    assert df.loc[0, "papeleras_presentes"] == "No"
+
+
+def test_calcular_iplu():
+    df = construir_resultados([
+        fila(evaluacion(limpieza_general=8, intensidad_basura="leve", acumulacion_basura="sí",
+                        recoleccion_urgente="Moderadamente Urgente", papeleras_presentes="No")),
+        fila(evaluacion()),
+        fila(evaluacion(limpieza_general="2", intensidad_basura="Alta", acumulacion_basura="Sí",
+                        recoleccion_urgente="Urgente", papeleras_presentes=None)),
+        fila("ERROR"),
+    ])
+    iplu = calcular_iplu(df).to_numpy()
+    assert iplu[:3] == pytest.approx([11, 0, 15])
+    assert np.isnan(iplu[3])
+
+
+def test_fila_completa_exige_imagen_etiqueta_y_evaluacion():
+    assert fila_completa(fila(evaluacion()))
+    assert not fila_completa([6.25, -75.57, "ERROR", "ERROR", None, None])
+    assert not fila_completa([6.25, -75.57, "img.jpg", "ERROR", evaluacion(), "pano"])
+    assert not fila_completa(fila(None))
+    assert not fila_completa(fila("ERROR"))
+
+
+PARAMS = {"latitud": "6.25", "longitud": "-75.57", "distancia": 100.0, "step": 20.0, "circular": False}
+
+
+def carpeta(tmp_path, nombre, status, **extra):
+    folder = tmp_path / nombre
+    folder.mkdir()
+    (folder / RunManifest.FILE_NAME).write_text(json.dumps({"params": PARAMS, "status": status, **extra}), encoding="utf-8")
+    return str(folder)
+
+
+def test_find_previous_omite_ejecuciones_completadas(tmp_path):
+    carpeta(tmp_path, "LT_T2", "completed")
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), PARAMS) is None
+
+
+def test_find_previous_reanuda_interrumpidas(tmp_path):
+    interrumpida = carpeta(tmp_path, "LT_T1", "interrupted")
+    carpeta(tmp_path, "LT_T2", "completed")
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), PARAMS) == interrumpida
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), dict(PARAMS, step=10.0)) is None
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), PARAMS, exclude={interrumpida}) is None
+
+
+def test_find_previous_omite_ejecuciones_en_curso(tmp_path):
+    folder = carpeta(tmp_path, "LT_T1", "interrupted")
+    RunManifest(folder, PARAMS).write("running")
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), PARAMS) is None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="la comprobación de procesos vivos solo existe en POSIX")
+def test_find_previous_reanuda_running_de_un_proceso_terminado(tmp_path):
+    proceso = subprocess.Popen([sys.executable, "-c", "pass"])
+    proceso.wait()
+    caida = carpeta(tmp_path, "LT_T1", "running", pid=proceso.pid, host=socket.gethostname())
+    assert RunManifest.find_previous(str(tmp_path / "LT_T*"), PARAMS) == caida
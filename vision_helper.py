@@ -5,8 +5,11 @@ import os
 import pandas as pd
 import numpy as np
 from tqdm import tqdm
-from geopy.distance import distance
 import concurrent.futures
+import contextvars
+import threading
+import time
+import random
 import requests
 from PIL import Image
 from io import BytesIO
@@ -18,35 +21,193 @@ import google.genai
 from geopy.point import Point
 import re
 from dotenv import load_dotenv
+from cache_helper import ImageCache, AssessmentCache
+from street_view_helper import StreetViewMetadata, StreetViewFetcher
+from pipeline_helper import Pipeline, Stage, RateLimiter
+from geo_helper import generar_puntos, subdividir, discrepancia_vecinos, dentro_de_zona, distancia_metros
+from iplu_helper import calcular_iplu
+from results_helper import ResultLog, RunManifest, point_key, construir_resultados, fila_completa
+from metrics_helper import METRICS, write_run_summary
+from spatial_helper import AssessmentStore
+from storage_helper import PanoramaArchive, archive_ref, parse_ref
+from cost_helper import CostModel, DailyQuota
+from osm_helper import RedVial
 
 load_dotenv()
 
+class Panorama():
+    """Panorámica en memoria; su codificación JPEG se calcula una sola vez y se reutiliza para Gemini y el disco."""
+    __QUALITY = int(os.getenv("PANORAMA_JPEG_QUALITY", "75"))
+
+    def __init__(self, image, quality=None):
+        self.image = image
+        self.quality = quality or self.__QUALITY
+        self.__jpeg = None
+        self.__lock = threading.Lock()
+
+    @property
+    def jpeg(self)-> bytes:
+        if self.__jpeg is None:
+            with self.__lock:
+                if self.__jpeg is None:
+                    buffer = BytesIO()
+                    self.image.save(buffer, format="JPEG", quality=self.quality)
+                    self.__jpeg = buffer.getvalue()
+        return self.__jpeg
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(self.jpeg)
+
+
 class Basuras():
     __API_KEY = os.getenv("API_KEY_STREET_VIEW")
+    __STREET_VIEW_URL = os.getenv("STREET_VIEW_BASE_URL", "https://maps.googleapis.com/maps/api/streetview").rstrip("/")
     __BASE_LOCATION = []
     __BASE_COORD= None
     __CAPTURE_DISTANCE = None
     __STEP = None
+    __CIRCULAR = False
+    __ADAPTIVE = False
+    __STREETS = False
+    __BUDGET = 0
     __RESULTS_FOLDER = None
+    __RESULTS_DIR = os.getenv("RESULTS_DIR", ".").rstrip("/")
     _LOCATION_NAME = None
-
-
-    def buscar_basuras_en_zona(self, latitud, longitud, distancia, step):
-        self.establecer_variables(latitud, longitud, distancia, step)
-        df = self.start_data_collection()
+    __YOLO_BATCH_SIZE = int(os.getenv("YOLO_BATCH_SIZE", "16"))
+    __YOLO_WORKERS = int(os.getenv("PIPELINE_YOLO_WORKERS", "1"))
+    __IMAGE_WORKERS = int(os.getenv("PIPELINE_IMAGE_WORKERS", "16"))
+    __GEMINI_WORKERS = int(os.getenv("PIPELINE_GEMINI_WORKERS", "4"))
+    __GEMINI_RPS = float(os.getenv("GEMINI_RPS", "4"))
+    __QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "32"))
+    __PERSIST_IMAGES = os.getenv("PERSIST_PANORAMAS", "1") == "1"
+    __SAVE_QUEUE = int(os.getenv("PANORAMA_SAVE_QUEUE", "8"))  # panorámicas pendientes de guardar, como máximo
+    __IMAGE_STORAGE = os.getenv("PANORAMA_STORAGE", "archive")  # "archive" (un archivo empaquetado) o "files"
+    __METRICS_FILE = os.getenv("METRICS_FILE")
+    __METRICS_PORT = os.getenv("METRICS_PORT")
+    __REUSE_METERS = float(os.getenv("ASSESSMENT_REUSE_METERS", "5"))
+    __REUSE_MAX_AGE = float(os.getenv("ASSESSMENT_REUSE_MAX_AGE_DAYS", "7")) * 86400
+    __ADAPTIVE_LEVELS = int(os.getenv("ADAPTIVE_LEVELS", "3"))
+    __ADAPTIVE_IPLU = float(os.getenv("ADAPTIVE_IPLU_THRESHOLD", "10"))
+    __ADAPTIVE_DISAGREEMENT = float(os.getenv("ADAPTIVE_DISAGREEMENT", "5"))
+    __RUN_BUDGET = int(os.getenv("RUN_MAX_POINTS", os.getenv("ADAPTIVE_MAX_POINTS", "0")))  # 0 = sin límite
+    __SCHEDULE_ORDER = os.getenv("SCHEDULE_ORDER", "center")  # "center", "unseen" o "grid"
+    # Carpetas de ejecuciones en curso en este proceso: dos trabajos iguales nunca comparten carpeta
+    __active_folders = set()
+    __active_lock = threading.Lock()
+
+    def __init__(self, image_cache=None, metadata_client=None, fetcher=None, store=None, quota=None):
+        self.__image_cache = image_cache if image_cache is not None else ImageCache()
+        self.__store = store if store is not None else AssessmentStore()
+        self.__quota = quota if quota is not None else DailyQuota()
+        self.__costs = CostModel()
+        self.__cascade = CascadePolicy()
+        self.__gemini_limiter = RateLimiter(self.__GEMINI_RPS)
+        self.__fetcher = fetcher if fetcher is not None else StreetViewFetcher.shared()
+        self.__metadata = metadata_client if metadata_client is not None else StreetViewMetadata(base_url=self.__STREET_VIEW_URL)
+        self.__yolo = VisionYolo()
+        # Cada petición a Gemini (incluidas las de un lote dividido) pasa por el límite GEMINI_RPS
+        self.__gemini = VisionGoogle(limiter=self.__gemini_limiter)
+        self.progress = {"done": 0, "total": 0}
+        self.df = None
+        self.df_streets = None
+        self.stage_stats = []
+        if self.__METRICS_PORT:
+            METRICS.serve(self.__METRICS_PORT)
+
+    def buscar_basuras_en_zona(self, latitud, longitud, distancia, step, circular=False, on_row=None, resume=False,
+                               adaptive=False, budget=None, streets=False):
+        self.establecer_variables(latitud, longitud, distancia, step, circular, resume, adaptive, budget, streets)
+        df = self.start_data_collection(on_row)
         
         return df
 
-    def establecer_variables(self, latitud, longitud, distancia, step):
+    def iterar_basuras_en_zona(self, latitud, longitud, distancia, step, circular=False, resume=False,
+                               adaptive=False, budget=None, streets=False):
+        """Igual que `buscar_basuras_en_zona`, pero entrega cada fila apenas se completa.
+
+        El avance queda en `self.progress` y, al agotarse el generador, el DataFrame completo en `self.df`.
+        """
+        self.establecer_variables(latitud, longitud, distancia, step, circular, resume, adaptive, budget, streets)
+        yield from self.iter_data_collection()
+
+    def establecer_variables(self, latitud, longitud, distancia, step, circular=False, resume=False,
+                             adaptive=False, budget=None, streets=False):
+        """Fija los parámetros de la zona.
+
+        Con `adaptive=True`, `step` es el paso mínimo: se empieza con una malla `2 ** ADAPTIVE_LEVELS` veces
+        más gruesa y solo se refinan las celdas sucias o con vecinas muy distintas.
+        `budget` limita los puntos nuevos de la ejecución (además del cupo diario DAILY_MAX_POINTS).
+        Con `streets=True` los puntos se toman cada `step` metros sobre las calles del extracto OSM_EXTRACT.
+        """
+        if streets and adaptive:
+            raise ValueError("El muestreo adaptativo no se puede combinar con el muestreo sobre calles")
         self.__BASE_LOCATION = [latitud, longitud]
         self.__BASE_COORD= Point(self.__BASE_LOCATION[0], self.__BASE_LOCATION[1])
         self.__CAPTURE_DISTANCE = [distancia, distancia]
         self.__STEP = step
+        self.__CIRCULAR = circular
+        self.__ADAPTIVE = adaptive
+        self.__STREETS = streets
+        self.__BUDGET = budget if budget is not None else self.__RUN_BUDGET
         self._LOCATION_NAME = f"LT{latitud.replace('.', '_')}LG{longitud.replace('.', '_')}"
-        self.__RESULTS_FOLDER = "./" + self._LOCATION_NAME + "_T" + pd.Timestamp.now().strftime("%Y%m%d_%H%M%S%f")
+        self.__RESULTS_FOLDER = f"{self.__RESULTS_DIR}/" + self._LOCATION_NAME + "_T" + pd.Timestamp.now().strftime("%Y%m%d_%H%M%S%f")
+        self.__RUN_PARAMS = {"latitud": latitud, "longitud": longitud, "distancia": float(distancia),
+                             "step": float(step), "circular": bool(circular)}
+        if adaptive:
+            self.__RUN_PARAMS.update({"adaptive": True, "levels": self.__ADAPTIVE_LEVELS,
+                                      "iplu": self.__ADAPTIVE_IPLU, "disagreement": self.__ADAPTIVE_DISAGREEMENT})
+        if streets:
+            self.__RUN_PARAMS["streets"] = True
+        if self.__BUDGET:
+            self.__RUN_PARAMS["budget"] = self.__BUDGET
+        with self.__active_lock:
+            if resume:
+                previous = RunManifest.find_previous(f"{self.__RESULTS_DIR}/{self._LOCATION_NAME}_T*", self.__RUN_PARAMS,
+                                                     exclude=self.__active_folders)
+                if previous:
+                    print(f"Reanudando la ejecución guardada en {previous}")
+                    self.__RESULTS_FOLDER = previous
+            self.__active_folders.add(self.__RESULTS_FOLDER)
+
+    @property
+    def results_folder(self):
+        """Carpeta de la ejecución en curso (o la última)."""
+        return self.__RESULTS_FOLDER
+
+    def get_images_by_coord(self, location, folder, pano_id=None):
+        """Obtiene imágenes de Google Street View para una ubicación (o panorámica) y las guarda como panorama."""
+        panorama = self.get_panorama(location, pano_id)
+        if panorama is None:
+            return None
+        image_path = self.panorama_path(location, folder)
+        return image_path if self.save_panorama(panorama, image_path) else None
+
+    def panorama_key(self, location):
+        return "LT"+location.replace(".", "_").replace(",","LG")
+
+    def panorama_path(self, location, folder):
+        return os.path.join(folder, f"{self.panorama_key(location)}.jpg")
 
-    def get_images_by_coord(self, location, folder):
-        """Obtiene imágenes de Google Street View para una ubicación y las guarda como panorama."""
+    def save_panorama(self, panorama, image_path):
+        """Guarda la panorámica en el archivo empaquetado de la ejecución o, si `image_path` es una ruta, como JPEG."""
+        with METRICS.timer("save") as timing:
+            try:
+                ref = parse_ref(image_path)
+                if ref is None:
+                    panorama.save(image_path)
+                else:
+                    folder, key = ref
+                    archive = PanoramaArchive.open(folder)
+                    archive.put(key, panorama.image, jpeg=panorama.jpeg if archive.format == "JPEG" else None)
+                return True
+            except Exception as e:
+                print(f"Error al guardar el panorama: {e}")
+                timing.outcome = "failure"
+                return False
+
+    def get_panorama(self, location, pano_id=None):
+        """Obtiene las cuatro imágenes de Street View y las une en una panorámica en memoria."""
         size = "600x300"
         fov = 120
         pitch = 0
@@ -55,62 +216,294 @@ class Basuras():
         images = []
         all_success = True
 
+        contents = {heading: self.__image_cache.get(location, heading, size, fov, pitch) for heading in headings}
+        missing = [heading for heading, content in contents.items() if content is None]
+        if missing:
+            contents.update(self.__fetcher.get_images(location, missing, size, fov, pitch, pano_id))
+
         for heading in headings:
-            url = f"https://maps.googleapis.com/maps/api/streetview?size={size}&location={location}&heading={heading}&fov={fov}&pitch={pitch}&key={self.__API_KEY}"
-            response = requests.get(url)
-            if response.status_code == 200:
-                try:
-                    img = Image.open(BytesIO(response.content))
-                    images.append(img)
-                except Exception as e:
-                    print(f"Error al procesar la imagen de {heading}: {e}")
-                    all_success = False
-            else:
-                print(f"Error al obtener las imágenes para la coordenada {heading}: {response.status_code}")
+            content = contents[heading]
+            if content is None:
+                print(f"Error al obtener las imágenes para la coordenada {heading}")
+                all_success = False
+                continue
+            try:
+                img = Image.open(BytesIO(content))
+                img.load()
+                images.append(img)
+                if heading in missing:
+                    self.__image_cache.put(location, heading, size, fov, pitch, content)
+            except Exception as e:
+                print(f"Error al procesar la imagen de {heading}: {e}")
                 all_success = False
 
         if all_success and images:
-            width, height = images[0].size
-            total_width = width * len(images)
-            panorama = Image.new('RGB', (total_width, height))
-
-            for i, img in enumerate(images):
-                panorama.paste(img, (i * width, 0))
-
-            time_stamp = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S%f")
-            location_name = "LT"+location.replace(".", "_").replace(",","LG")
-            image_path = os.path.join(folder, f"{location_name}.jpg")
+            with METRICS.timer("stitch"):
+                width, height = images[0].size
+                total_width = width * len(images)
+                panorama = Image.new('RGB', (total_width, height))
 
-            try:
-                panorama.save(image_path)
-                print(f"Panorama guardado en: {image_path}")
+                for i, img in enumerate(images):
+                    panorama.paste(img, (i * width, 0))
 
-                return image_path
-            except Exception as e:
-                print(f"Error al guardar el panorama: {e}")
-                return None
+            return Panorama(panorama)
         else:
             print(f"No se pudieron obtener imágenes válidas para {location}")
             return None
-    def capture_image_and_create_row(self, x, y, coord, folder):
-        """Captura una imagen y crea una fila para el DataFrame."""
-        new_coord = distance(meters=x).destination(coord, bearing=0)
-        new_coord = distance(meters=y).destination(new_coord, bearing=90)
-
-        string_coord = "{:06f}".format(new_coord.latitude), "{:06f}".format(new_coord.longitude)
-        string_coord = f"{string_coord[0]},{string_coord[1]}"
-
-        image_path = self.get_images_by_coord(string_coord, folder)
-        if image_path:
-            img = Image.open(image_path)
-            vision_yolo = VisionYolo()
-            label = vision_yolo.get_yolo_label(img)
-            description = VisionGoogle().get_gemini_description(img)
-            return [new_coord.latitude, new_coord.longitude, image_path, label, description]
+    def capture_images(self, item):
+        """Etapa de E/S: descarga la panorámica del grupo; el guardado en disco queda en segundo plano."""
+        group = item["group"]
+        with METRICS.timer("imagery") as timing:
+            panorama = self.get_panorama(group["location"], group["pano_id"])
+            if panorama is None:
+                timing.outcome = "failure"
+        if panorama is None:
+            item["image_path"] = "ERROR"
+            return item
+
+        item["img"] = panorama
+        item["image_path"] = None
+        if self.__PERSIST_IMAGES:
+            if self.__IMAGE_STORAGE == "archive":
+                item["image_path"] = archive_ref(self.__RESULTS_FOLDER, self.panorama_key(group["location"]))
+            else:
+                item["image_path"] = self.panorama_path(group["location"], self.__RESULTS_FOLDER)
+            # Si el guardado se atrasa, la etapa de imágenes espera: la memoria queda acotada
+            self.__save_slots.acquire()
+            future = self.__saver.submit(contextvars.copy_context().run, self.save_panorama, panorama, item["image_path"])
+            future.add_done_callback(lambda _: self.__save_slots.release())
+        return item
+
+    def classify_images(self, items):
+        """Etapa de CPU: clasifica con YOLO, en una sola pasada, las panorámicas válidas del lote."""
+        valid = [item for item in items if item.get("img") is not None]
+        try:
+            with METRICS.timer("yolo"):
+                predictions = self.__yolo.get_yolo_predictions([item["img"].image for item in valid])
+            METRICS.inc("basuras_yolo_images_total", len(valid))
+        except Exception as e:
+            print(f"Error al clasificar el lote: {e}")
+            predictions = [None] * len(valid)
+        for item, prediction in zip(valid, predictions):
+            item["yolo"] = prediction
+            item["label"] = prediction["label"] if prediction else "ERROR"
+        return items
+
+    def describe_images(self, items):
+        """Etapa remota: evalúa con Gemini las panorámicas del lote que la cascada no resuelve con YOLO."""
+        valid = [item for item in items if item.get("img") is not None]
+        decisions = [self.__cascade.decide(item.get("yolo")) for item in valid]
+        remote = [item for item, decision in zip(valid, decisions) if decision != "skip"]
+        if remote:
+            descriptions = self.__gemini.get_gemini_descriptions([item["img"] for item in remote])
+            for item, description in zip(remote, descriptions):
+                item["description"] = description
+        for item, decision in zip(valid, decisions):
+            if decision == "skip":
+                item["description"] = self.__cascade.default_assessment(item["yolo"])
+            elif decision in ("audit", "shadow"):
+                self.__cascade.record_audit(item["yolo"], item.get("description"))
+            item["img"] = None
+        return items
+
+    def create_rows(self, item):
+        """Crea una fila para cada punto que apunta a la panorámica del elemento."""
+        group = item["group"]
+        image_path = item.get("image_path", "ERROR")
+        label = item.get("label", "ERROR")
+        description = item.get("description")
+        return [[latitude, longitude, image_path, label, description, group["pano_id"]] for latitude, longitude in item["points"]]
+
+    def write_run_metrics(self):
+        """Guarda en la carpeta de resultados el resumen de la ejecución y la exposición Prometheus."""
+        summary = self.__run_metrics.run_summary()
+        summary.update({
+            "params": self.__RUN_PARAMS,
+            "progress": self.progress,
+            "pipeline": self.stage_stats,
+            "image_cache": self.__image_cache.stats(),
+            "panoramas": PanoramaArchive.open(self.__RESULTS_FOLDER).stats() if PanoramaArchive.exists(self.__RESULTS_FOLDER) else None,
+            "assessment_store": self.__store.stats(),
+            "assessment_cache": self.__gemini.cache_stats(),
+            "cascade": self.__cascade.report(),
+            "street_network": RedVial.cargar().stats() if self.__STREETS else None,
+            "street_view": self.__fetcher.stats,
+        })
+        write_run_summary(f"{self.__RESULTS_FOLDER}/run_summary.json", summary)
+        self.__run_metrics.write(f"{self.__RESULTS_FOLDER}/metrics.prom")
+        if self.__METRICS_FILE:
+            METRICS.write(self.__METRICS_FILE)
+        cascade = summary["cascade"]
+        if cascade["evaluated"]:
+            print(f"Cascada YOLO: {cascade['skipped']} de {cascade['evaluated']} imágenes sin Gemini, "
+                  f"{cascade['audited'] + cascade['shadowed']} auditadas (concordancia {cascade['audit_agreement']})")
+        print(f"Resumen de la ejecución guardado en {self.__RESULTS_FOLDER}/run_summary.json")
+        return summary
+
+    def start_data_collection(self, on_row=None):
+        for row in self.iter_data_collection():
+            if on_row is not None:
+                on_row(row)
+        return self.df
+
+    def estimar_costo(self, latitud, longitud, distancia, step, circular=False, budget=None, streets=False):
+        """Estimación previa, sin llamadas remotas, de puntos, llamadas, tokens, bytes y costo de una zona.
+
+        Descuenta los puntos que se reutilizarían del almacén y aplica el presupuesto de la ejecución y el
+        cupo diario. En modo adaptativo es el máximo (la malla uniforme al paso mínimo).
+        """
+        points = self.generate_points(latitud, longitud, distancia, step, circular, streets)
+        reused = self.__store.reutilizables(points, self.__REUSE_METERS, self.__REUSE_MAX_AGE)
+        pending = len(points) - len(reused)
+        allowed = pending
+        budget = budget if budget is not None else self.__RUN_BUDGET
+        if budget:
+            allowed = min(allowed, budget)
+        available = self.__quota.disponibles()
+        if available is not None:
+            allowed = min(allowed, available)
+        estimate = self.__costs.estimar(len(points), len(reused), allowed, self.__gemini.prompt_tokens, self.__gemini.batch_size)
+        estimate["omitidos_presupuesto"] = pending - allowed
+        estimate["cupo_diario_disponible"] = available
+        return estimate
+
+    @staticmethod
+    def generate_points(latitud, longitud, distancia, step, circular=False, streets=False):
+        """Malla de la zona o, con `streets=True`, puntos cada `step` metros sobre la red vial."""
+        if streets:
+            return RedVial.cargar().puntos_en_calles(latitud, longitud, distancia, step, circular)[0]
+        return generar_puntos(float(latitud), float(longitud), distancia, step, circular=circular)
+
+    def schedule_points(self, points):
+        """Ordena los puntos según SCHEDULE_ORDER para que una ejecución recortada cubra lo más útil primero:
+        "center" (del centro hacia afuera), "unseen" (primero los nunca evaluados, luego los más antiguos) o
+        "grid" (orden de la malla)."""
+        if not len(points) or self.__SCHEDULE_ORDER == "grid":
+            return points
+        if self.__SCHEDULE_ORDER == "unseen":
+            order = np.nan_to_num(self.__store.ultima_evaluacion(points, self.__REUSE_METERS), nan=-np.inf)
         else:
-            return [new_coord.latitude, new_coord.longitude, "ERROR", "ERROR"]
-
-    def start_data_collection(self):
+            order = distancia_metros(points[:, 0], points[:, 1],
+                                     (self.__BASE_COORD.latitude, self.__BASE_COORD.longitude))
+        return points[np.argsort(order, kind="stable")]
+
+    def apply_budget(self, points):
+        """Recorta los puntos al presupuesto de la ejecución y al cupo diario, que queda reservado."""
+        allowed = len(points)
+        if self.__BUDGET:
+            allowed = min(allowed, max(0, self.__BUDGET - self.__api_points))
+        allowed = self.__quota.reservar(allowed)
+        if allowed < len(points):
+            print(f"Presupuesto agotado: se omiten {len(points) - allowed} puntos")
+            METRICS.inc("basuras_points_total", len(points) - allowed, outcome="skipped_budget")
+        return points[:allowed]
+
+    def __process_points(self, points, by_key, rows, result_log, pbar, schedule=True):
+        """Procesa los puntos que aún no tienen fila y entrega cada fila nueva a medida que se completa.
+
+        Con `schedule=False` se conserva el orden recibido (p. ej. el de prioridad del refinamiento adaptativo).
+        """
+        pending = np.array([point_key(latitude, longitude) not in by_key for latitude, longitude in points], dtype=bool)
+        points = points[pending]
+
+        # Los puntos con una evaluación reciente a pocos metros se toman del almacén espacial
+        reused = self.__store.reutilizables(points, self.__REUSE_METERS, self.__REUSE_MAX_AGE)
+        if reused:
+            print(f"{len(reused)} puntos reutilizados de evaluaciones anteriores")
+            METRICS.inc("basuras_points_total", len(reused), outcome="reused")
+            points = np.delete(points, list(reused), axis=0)
+        if schedule:
+            points = self.schedule_points(points)
+        points = self.apply_budget(points)
+        locations = ["{:06f},{:06f}".format(latitude, longitude) for latitude, longitude in points]
+
+        # Pre-paso: agrupar los puntos que caen en la misma panorámica y descartar los que no tienen cobertura
+        with METRICS.timer("metadata"):
+            groups, no_coverage = self.__metadata.resolve_panoramas(locations)
+        METRICS.inc("basuras_points_total", len(no_coverage), outcome="no_coverage")
+        print(f"{len(points)} puntos generados, {len(groups)} panorámicas únicas, {len(no_coverage)} puntos sin cobertura")
+        self.__api_points += len(points)
+
+        self.progress["total"] += len(reused) + len(points) - len(no_coverage)
+        pbar.total = self.progress["total"]
+        pbar.refresh()
+
+        def emit(row):
+            by_key[point_key(row[0], row[1])] = row
+            rows.append(row)
+            result_log.append(row)
+            self.progress["done"] += 1
+            pbar.update(1)
+            return row
+
+        for row in reused.values():
+            yield emit(row)
+        if not groups:
+            return
+
+        pipeline = Pipeline([
+            Stage("imagery", self.capture_images, workers=self.__IMAGE_WORKERS, queue_size=self.__QUEUE_SIZE),
+            Stage("yolo", self.classify_images, workers=self.__YOLO_WORKERS, queue_size=self.__QUEUE_SIZE,
+                  batch_size=self.__YOLO_BATCH_SIZE),
+            Stage("gemini", self.describe_images, workers=self.__GEMINI_WORKERS, queue_size=self.__QUEUE_SIZE,
+                  batch_size=self.__gemini.batch_size, max_wait=0.5),
+        ], output_size=self.__QUEUE_SIZE)
+        items = ({"group": group, "points": points[group["points"]].tolist()} for group in groups.values())
+        for item in pipeline.run(items):
+            group_rows = self.create_rows(item)
+            METRICS.inc("basuras_points_total", len(group_rows),
+                        outcome="failure" if item.get("image_path", "ERROR") == "ERROR" else "success")
+            # Las evaluaciones solo de YOLO no se reutilizan en otras zonas
+            self.__store.agregar([row for row in group_rows if not CascadePolicy.is_default(row[4])])
+            for row in group_rows:
+                yield emit(row)
+        self.stage_stats.extend(pipeline.stats())
+
+    def refine_points(self, points, by_key, step):
+        """Elige las celdas de lado `step` a subdividir y devuelve los puntos del siguiente nivel.
+
+        Se refinan las celdas con IPLU alto y las que difieren mucho de alguna vecina, empezando por las de
+        mayor puntaje cuando el presupuesto de puntos no alcanza para todas.
+        """
+        level_rows = [by_key.get(point_key(latitude, longitude)) for latitude, longitude in points]
+        known = [i for i, row in enumerate(level_rows) if row is not None]
+        iplu = np.full(len(points), np.nan)
+        if known:
+            iplu[known] = calcular_iplu(construir_resultados([level_rows[i] for i in known])).to_numpy()
+        disagreement = discrepancia_vecinos(points, iplu, step)
+
+        refine = (iplu >= self.__ADAPTIVE_IPLU) | (disagreement >= self.__ADAPTIVE_DISAGREEMENT)
+        score = np.fmax(np.nan_to_num(iplu, nan=0.0), disagreement)[refine]
+        parents = points[refine][np.argsort(-score, kind="stable")]
+
+        children = subdividir(parents, step)
+        children = children[dentro_de_zona(children, self.__BASE_COORD.latitude, self.__BASE_COORD.longitude,
+                                           self.__CAPTURE_DISTANCE[0], self.__CIRCULAR)]
+        if self.__BUDGET:
+            children = children[:max(0, self.__BUDGET - self.__api_points)]
+        print(f"Paso {step / 2:g} m: {len(parents)} celdas a refinar, {len(children)} puntos nuevos")
+        if not len(children):
+            return children
+        return np.concatenate([parents, children])
+
+    def iter_data_collection(self):
+        """Ejecuta la captura de la zona entregando cada fila; si se interrumpe, la deja marcada como
+        reanudable y libera la carpeta."""
+        self.__manifest = None
+        completed = False
+        try:
+            # Registro de métricas propio: otras ejecuciones del proceso (trabajos de la API) no se suman
+            with METRICS.run_scope() as self.__run_metrics:
+                yield from self.__collect()
+            completed = True
+        finally:
+            if not completed and self.__manifest is not None:
+                self.__manifest.write("interrupted")
+            PanoramaArchive.release(self.__RESULTS_FOLDER)
+            with self.__active_lock:
+                self.__active_folders.discard(self.__RESULTS_FOLDER)
+
+    def __collect(self):
         print("Iniciando proceso de captura de datos")
         print("Por favor espere...")
 
@@ -121,43 +514,75 @@ class Basuras():
         else:
             print(f"Carpeta {self.__RESULTS_FOLDER} ya existe.")
 
-        total = (self.__CAPTURE_DISTANCE[0] * self.__CAPTURE_DISTANCE[1]) / (self.__STEP ** 2)
-        pbar = tqdm(total=total, dynamic_ncols=True, position=0, leave=True,
-                    bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{rate_fmt}] {postfix}", colour='cyan')
+        manifest = self.__manifest = RunManifest(self.__RESULTS_FOLDER, self.__RUN_PARAMS)
+        manifest.write("running")
+        log_path = f"{self.__RESULTS_FOLDER}/{self._LOCATION_NAME}.jsonl"
 
-        df = pd.DataFrame(columns=["Latitude", "Longitude", "Image", "Label", "Description"])
-        rows = []
+        # Las filas completas (con imagen, etiqueta y evaluación) de una ejecución anterior no se vuelven a procesar
+        rows = [row for row in ResultLog.read(log_path) if fila_completa(row)]
+        by_key = {point_key(row[0], row[1]): row for row in rows}
 
-        x_origin = -1 * (self.__CAPTURE_DISTANCE[0] / 2)
-        x_end = self.__CAPTURE_DISTANCE[0] / 2
-        y_origin = -1 * (self.__CAPTURE_DISTANCE[1] / 2)
-        y_end = self.__CAPTURE_DISTANCE[1] / 2
+        # En modo adaptativo se parte de una malla gruesa que se refina hasta el paso pedido
+        step = self.__STEP * 2 ** self.__ADAPTIVE_LEVELS if self.__ADAPTIVE else self.__STEP
+        with METRICS.timer("geo"):
+            points = self.generate_points(self.__BASE_COORD.latitude, self.__BASE_COORD.longitude,
+                                          self.__CAPTURE_DISTANCE[0], step, self.__CIRCULAR, self.__STREETS)
+        if rows:
+            print(f"{len(rows)} puntos recuperados del registro")
 
-        with concurrent.futures.ThreadPoolExecutor() as executor:
-            futures = []
-            for x in np.arange(x_origin, x_end, self.__STEP):
-                for y in np.arange(y_origin, y_end, self.__STEP):
-                    futures.append(executor.submit(self.capture_image_and_create_row, x, y, self.__BASE_COORD, self.__RESULTS_FOLDER))
+        self.progress = {"done": 0, "total": len(rows)}
+        for row in rows:
+            self.progress["done"] += 1
+            yield row
+        pbar = tqdm(total=self.progress["total"], initial=self.progress["done"], dynamic_ncols=True, position=0, leave=True,
+                    bar_format="{l_bar}{bar}| {n_fmt}/{total_fmt} [{rate_fmt}] {postfix}", colour='cyan')
 
-            for future in concurrent.futures.as_completed(futures):
-                rows.append(future.result())
-                pbar.update(1)
+        VisionYolo.warmup()
+        self.__cascade = CascadePolicy()
+        self.stage_stats = []
+        self.df_streets = None
+        self.__api_points = 0
+        self.__saver = concurrent.futures.ThreadPoolExecutor(max_workers=2, thread_name_prefix="saver")
+        self.__save_slots = threading.BoundedSemaphore(self.__SAVE_QUEUE)
+        with self.__saver, ResultLog(log_path) as result_log:
+            schedule = True
+            while True:
+                yield from self.__process_points(points, by_key, rows, result_log, pbar, schedule)
+                schedule = False
+                if not self.__ADAPTIVE or step <= self.__STEP:
+                    break
+                points = self.refine_points(points, by_key, step)
+                step /= 2
+                if not len(points):
+                    break
 
         pbar.close()
 
-        for row in rows:
-            df.loc[len(df)] = row
+        df = construir_resultados(rows)
 
         print("Proceso finalizado")
         print("Se han tomado", len(df), "capturas")
         df.to_csv(f"{self.__RESULTS_FOLDER}/{self._LOCATION_NAME}.csv")
-
-        return df
+        if self.__STREETS:
+            # IPLU agregado por tramo de calle (entre intersecciones)
+            self.df_streets = RedVial.cargar().iplu_por_tramo(df)
+            self.df_streets.to_csv(f"{self.__RESULTS_FOLDER}/{self._LOCATION_NAME}_calles.csv", index=False)
+            print(f"IPLU agregado en {len(self.df_streets)} tramos de calle")
+        self.write_run_metrics()
+        manifest.write("completed")
+        self.df = df
 
 
 
 class VisionGoogle():
     __API_KEY = os.getenv("API_KEY_VISION_GOOGLE")
+    __MODEL = os.getenv("GEMINI_MODEL", "gemini-2.0-flash")
+    __BASE_URL = os.getenv("GEMINI_BASE_URL")  # permite apuntar a un servidor local de pruebas
+    __BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "1"))
+    __REQUIRED_KEYS = ("es_imagen_valida", "limpieza_general", "acumulacion_basura", "intensidad_basura",
+                       "recoleccion_urgente", "papeleras_presentes", "justificacion")
+    __client = None
+    __client_lock = threading.Lock()
 
     __description_prompt=  """
     Eres un experto en análisis visual de calles para apoyar la gestión eficiente del aseo urbano. Recibirás una imagen compuesta por cuatro tomas distintas de una misma calle. Realiza el siguiente procedimiento de análisis:
@@ -196,6 +621,13 @@ class VisionGoogle():
     No añadas ningún texto adicional OBLIGATORIO: NO USAR formato markdown en la salida.
     Responde siempre en idioma: "Spanish"
     """
+
+    __batch_instructions = """
+    # Modo por lotes
+        Recibirás {total} imágenes, cada una precedida por la etiqueta "Imagen <n>:". Analiza cada imagen por separado
+        siguiendo el procedimiento anterior y responde con un arreglo JSON de exactamente {total} objetos, en el mismo
+        orden de las imágenes. Cada objeto debe tener el formato indicado más el campo "indice": <n>.
+    """
     def get_image_from_location(self, location: str):
         """Obtiene imágenes de Google Street View y las organiza correctamente con padding."""
 
@@ -247,33 +679,318 @@ class VisionGoogle():
         return img_con_padding
 
 
+    def __init__(self, cache=None, batch_size=None, limiter=None):
+        self.__cache = cache if cache is not None else AssessmentCache(self.__description_prompt, self.__MODEL)
+        self.batch_size = batch_size or self.__BATCH_SIZE
+        self.__limiter = limiter
+
+    @classmethod
+    def get_client(cls):
+        """Devuelve el cliente de Gemini compartido por todo el proceso."""
+        if cls.__client is None:
+            with cls.__client_lock:
+                if cls.__client is None:
+                    http_options = google.genai.types.HttpOptions(base_url=cls.__BASE_URL) if cls.__BASE_URL else None
+                    cls.__client = google.genai.Client(api_key=cls.__API_KEY, http_options=http_options)
+        return cls.__client
+
+    def __generate(self, contents):
+        if self.__limiter is not None:
+            self.__limiter.wait()
+        return self.get_client().models.generate_content(model=self.__MODEL, contents=contents)
+
+    def __parse_response(self, text):
+        text = text.strip().replace('```json','').replace('```','')
+        return json.loads(text)
+
+    def cache_stats(self):
+        return self.__cache.stats()
+
+    @property
+    def prompt_tokens(self):
+        """Tokens aproximados del prompt (unos 4 caracteres por token), para estimar costos."""
+        prompt = self.__description_prompt + (self.__batch_instructions if self.batch_size > 1 else "")
+        return len(prompt) // 4
+
+    def __cache_key(self, img):
+        return self.__cache.make_key(img.image if isinstance(img, Panorama) else img)
+
+    def __as_content(self, img):
+        """Una `Panorama` se envía con su JPEG ya codificado; una imagen PIL la codifica el SDK."""
+        if isinstance(img, Panorama):
+            return google.genai.types.Part.from_bytes(data=img.jpeg, mime_type="image/jpeg")
+        return img
+
     def get_gemini_description(self, img):
         """Obtiene una descripción de una imagen usando la API de Cloud Vision."""
+        key = self.__cache_key(img)
+        description = self.__cache.get(key)
+        if description is not None:
+            return description
+        return self.__describe_single(img, key)
+
+    def __describe_single(self, img, key):
         try:
-            client = google.genai.Client(api_key=self.__API_KEY)
-            model = client.models  # Accedemos al objeto models.
-
-            response_gemini = model.generate_content(
-                model='gemini-2.0-flash',
-                contents=[
-                    self.__description_prompt,
-                    img
-                ]
-            )
-
-            description = response_gemini.text.strip()
-            description = description.replace('```json','').replace('```','')
-            description = json.loads(description)
+            start = time.monotonic()
+            with METRICS.timer("gemini", mode="single"):
+                response_gemini = self.__generate([self.__description_prompt, self.__as_content(img)])
+            METRICS.inc("basuras_gemini_images_total")
+
+            with METRICS.timer("parse"):
+                description = self.__parse_response(response_gemini.text)
+            self.__cache.put(key, description, time.monotonic() - start)
             return description
         except Exception as e:
             print(f"Error al obtener la descripción: {e}")
             return None
 
+    def get_gemini_descriptions(self, images):
+        """Evalúa varias imágenes enviándolas a Gemini en lotes de `batch_size`. Devuelve las descripciones en orden."""
+        keys = [self.__cache_key(img) for img in images]
+        descriptions = [self.__cache.get(key) for key in keys]
+        pending = [i for i, description in enumerate(descriptions) if description is None]
+
+        for start in range(0, len(pending), self.batch_size):
+            chunk = pending[start:start + self.batch_size]
+            results = self.__describe_batch([images[i] for i in chunk], [keys[i] for i in chunk])
+            for i, description in zip(chunk, results):
+                descriptions[i] = description
+        return descriptions
+
+    def __describe_batch(self, images, keys):
+        """Envía un lote en una sola petición; si la respuesta no es válida, divide el lote y reintenta."""
+        if len(images) == 1:
+            return [self.__describe_single(images[0], keys[0])]
+
+        start = time.monotonic()
+        contents = [self.__description_prompt + self.__batch_instructions.format(total=len(images))]
+        for n, img in enumerate(images, start=1):
+            contents.extend([f"Imagen {n}:", self.__as_content(img)])
+        try:
+            with METRICS.timer("gemini", mode="batch"):
+                response_gemini = self.__generate(contents)
+        except Exception as e:
+            # Errores de red o de la API (cuota, 5xx): dividir el lote solo multiplicaría las peticiones.
+            # Las imágenes quedan sin evaluación y se reintentan al reanudar la ejecución.
+            print(f"Error al evaluar un lote de {len(images)} imágenes: {e}")
+            return [None] * len(images)
+        METRICS.inc("basuras_gemini_images_total", len(images))
+        try:
+            with METRICS.timer("parse"):
+                descriptions = self.__validate_batch(self.__parse_response(response_gemini.text), len(images))
+        except (ValueError, TypeError, AttributeError) as e:
+            # json.JSONDecodeError es un ValueError; TypeError/AttributeError cubren una respuesta sin texto
+            print(f"Respuesta inválida para un lote de {len(images)} imágenes, se divide: {e}")
+            middle = len(images) // 2
+            return self.__describe_batch(images[:middle], keys[:middle]) + self.__describe_batch(images[middle:], keys[middle:])
+
+        latency = (time.monotonic() - start) / len(images)
+        for key, description in zip(keys, descriptions):
+            self.__cache.put(key, description, latency)
+        return descriptions
+
+    def __validate_batch(self, parsed, total):
+        """Verifica que la respuesta sea un arreglo con una evaluación completa por imagen y la ordena por índice."""
+        if not isinstance(parsed, list) or len(parsed) != total:
+            raise ValueError(f"se esperaban {total} evaluaciones")
+        by_index = {}
+        for n, description in enumerate(parsed, start=1):
+            if not isinstance(description, dict) or any(k not in description for k in self.__REQUIRED_KEYS):
+                raise ValueError(f"evaluación incompleta en la posición {n}")
+            by_index[description.pop("indice", n)] = description
+        if sorted(by_index) != list(range(1, total + 1)):
+            raise ValueError("índices de imagen inconsistentes")
+        return [by_index[n] for n in range(1, total + 1)]
+
 class VisionYolo():
-    __model_path = "best.pt"
+    __model_path = os.getenv("YOLO_MODEL_PATH", "best.pt")
+    __model = None
+    __load_lock = threading.Lock()
+    __predict_lock = threading.Lock()
+    __temperature = float(os.getenv("YOLO_TEMPERATURE", "1.0"))
+
+    @classmethod
+    def get_model(cls):
+        """Carga el modelo YOLO una sola vez por proceso (thread-safe)."""
+        if cls.__model is None:
+            with cls.__load_lock:
+                if cls.__model is None:
+                    cls.__model = YOLO(cls.__model_path)
+        return cls.__model
+
+    @classmethod
+    def set_model(cls, model):
+        """Sustituye el modelo del proceso (p. ej. por un stub en los benchmarks)."""
+        with cls.__load_lock:
+            cls.__model = model
+
+    @classmethod
+    def warmup(cls, size=(2400, 300)):
+        """Carga el modelo y ejecuta una inferencia en vacío para evitar la latencia del primer punto."""
+        model = cls.get_model()
+        with cls.__predict_lock:
+            model(Image.new('RGB', size), verbose=False)
+        return model
+
     def get_yolo_label(self, img)-> str:
         """Obtiene la etiqueta de clasificación de una imagen."""
-        model = YOLO(self.__model_path)  # Reemplaza con la ruta a tu modelo
-        results = model(img)
-        etiqueta = results[0].names[results[0].probs.top1]
-        return etiqueta
\ No newline at end of file
+        return self.get_yolo_labels([img])[0]
+
+    def get_yolo_labels(self, images)-> list:
+        """Clasifica varias imágenes en una sola pasada del modelo y devuelve sus etiquetas en orden."""
+        return [prediction["label"] for prediction in self.get_yolo_predictions(images)]
+
+    def get_yolo_predictions(self, images)-> list:
+        """Clasifica varias imágenes en una sola pasada y devuelve, para cada una, la etiqueta, su confianza y las
+        probabilidades de todas las clases, calibradas con la temperatura YOLO_TEMPERATURE."""
+        if not images:
+            return []
+        model = self.get_model()
+        # El predictor de ultralytics no es seguro entre hilos
+        with self.__predict_lock:
+            results = model(list(images), verbose=False)
+        predictions = []
+        for result in results:
+            data = result.probs.data
+            raw = np.asarray(data.cpu().numpy() if hasattr(data, "cpu") else data, dtype=float)
+            probabilities = self.scale_probabilities(raw, self.__temperature)
+            top1 = int(np.argmax(probabilities))
+            names = [result.names[i] for i in range(len(probabilities))]
+            predictions.append({
+                "label": names[top1],
+                "confidence": float(probabilities[top1]),
+                "probs": dict(zip(names, probabilities.tolist())),
+                "raw": raw.tolist(),
+            })
+        return predictions
+
+    @staticmethod
+    def scale_probabilities(probabilities, temperature):
+        """Escalado por temperatura (T > 1 suaviza, T < 1 concentra) sobre el último eje."""
+        logits = np.log(np.clip(probabilities, 1e-12, 1.0)) / temperature
+        logits = logits - logits.max(axis=-1, keepdims=True)
+        exp = np.exp(logits)
+        return exp / exp.sum(axis=-1, keepdims=True)
+
+    @classmethod
+    def fit_temperature(cls, probabilities, positive, targets):
+        """Temperatura que minimiza la log-verosimilitud negativa de `targets` (bool) para la probabilidad
+        agregada de las clases `positive` (máscara de columnas)."""
+        probabilities, targets = np.asarray(probabilities, dtype=float), np.asarray(targets, dtype=bool)
+        best_nll, best_temperature = None, 1.0
+        for temperature in np.linspace(0.25, 5.0, 96):
+            p = cls.scale_probabilities(probabilities, temperature)[:, positive].sum(axis=1).clip(1e-6, 1 - 1e-6)
+            nll = -np.mean(np.where(targets, np.log(p), np.log(1 - p)))
+            if best_nll is None or nll < best_nll:
+                best_nll, best_temperature = nll, float(temperature)
+        return best_temperature
+
+
+class CascadePolicy():
+    """Decide qué panorámicas necesitan a Gemini a partir de la predicción calibrada de YOLO.
+
+    Las imágenes que YOLO clasifica como limpias (YOLO_CLEAN_LABELS) con confianza >= CASCADE_CONFIDENCE
+    reciben una evaluación por defecto sin llamar a Gemini, salvo una muestra aleatoria de auditoría
+    (CASCADE_AUDIT_RATE) que sí se envía y sirve para medir cuánto coinciden ambas evaluaciones.
+
+    La cascada solo se activa por defecto cuando YOLO_TEMPERATURE está calibrada; mientras tanto
+    (o con CASCADE_CONFIDENCE > 1) todas las imágenes van a Gemini y las que YOLO clasifica como limpias se
+    registran como auditorías para sugerir la temperatura.
+    """
+    __THRESHOLD = float(os.getenv("CASCADE_CONFIDENCE", "0.9" if os.getenv("YOLO_TEMPERATURE") else "1.1"))
+    __AUDIT_RATE = float(os.getenv("CASCADE_AUDIT_RATE", "0.05"))
+    __CLEAN_LABELS = {label.strip().lower() for label in os.getenv("YOLO_CLEAN_LABELS", "limpia,limpio,clean").split(",")}
+    __DEFAULT_SCORE = int(os.getenv("CASCADE_DEFAULT_SCORE", "9"))
+    __CLEAN_MIN_SCORE = int(os.getenv("CASCADE_CLEAN_MIN_SCORE", "7"))
+
+    def __init__(self, threshold=None, audit_rate=None, seed=None):
+        self.threshold = self.__THRESHOLD if threshold is None else threshold
+        self.audit_rate = self.__AUDIT_RATE if audit_rate is None else audit_rate
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__counts = {"skip": 0, "audit": 0, "shadow": 0, "gemini": 0}
+        self.__audits = []  # (probabilidades sin calibrar, máscara de clases limpias, Gemini la ve limpia, |Δ limpieza|)
+
+    @property
+    def enabled(self):
+        return self.threshold <= 1
+
+    def __is_clean(self, prediction):
+        return prediction is not None and prediction["label"].lower() in self.__CLEAN_LABELS
+
+    def decide(self, prediction):
+        """Devuelve "skip" (evaluación por defecto), "audit" (confiable pero se verifica), "shadow" (cascada
+        desactivada: va a Gemini y se registra para calibrar) o "gemini"."""
+        if not self.__is_clean(prediction):
+            decision = "gemini"
+        elif not self.enabled:
+            decision = "shadow"
+        elif prediction["confidence"] < self.threshold:
+            decision = "gemini"
+        else:
+            with self.__lock:
+                decision = "audit" if self.__random.random() < self.audit_rate else "skip"
+        with self.__lock:
+            self.__counts[decision] += 1
+        METRICS.inc("basuras_cascade_total", decision=decision)
+        return decision
+
+    @staticmethod
+    def is_default(description):
+        """Indica si la evaluación la generó la cascada (solo YOLO) y no Gemini."""
+        return isinstance(description, dict) and description.get("origen") == "yolo"
+
+    def default_assessment(self, prediction):
+        # es_imagen_valida queda sin valor: solo Gemini valida la imagen
+        return {
+            "origen": "yolo",
+            "es_imagen_valida": None,
+            "limpieza_general": self.__DEFAULT_SCORE,
+            "acumulacion_basura": "No",
+            "intensidad_basura": "No Aplica",
+            "recoleccion_urgente": "No urgente",
+            "papeleras_presentes": None,
+            "justificacion": f"Evaluación derivada de YOLO ({prediction['label']}, confianza {prediction['confidence']:.2f}) "
+                             "sin consultar a Gemini.",
+        }
+
+    def record_audit(self, prediction, description):
+        """Compara la evaluación de Gemini de una imagen auditada con la que habría dado la cascada."""
+        if not isinstance(description, dict):
+            return
+        try:
+            score = float(description.get("limpieza_general"))
+        except (TypeError, ValueError):
+            return
+        clean = str(description.get("acumulacion_basura", "")).strip().lower() == "no" and score >= self.__CLEAN_MIN_SCORE
+        positive = [name.lower() in self.__CLEAN_LABELS for name in prediction["probs"]]
+        with self.__lock:
+            self.__audits.append((prediction["raw"], positive, clean, abs(score - self.__DEFAULT_SCORE)))
+        METRICS.inc("basuras_cascade_audit_total", agreement="yes" if clean else "no")
+
+    def report(self):
+        """Resumen de la cascada: llamadas evitadas y concordancia con Gemini en la muestra auditada."""
+        with self.__lock:
+            counts, audits = dict(self.__counts), list(self.__audits)
+        total = sum(counts.values())
+        report = {
+            "evaluated": total,
+            "skipped": counts["skip"],
+            "audited": counts["audit"],
+            "shadowed": counts["shadow"],
+            "sent_to_gemini": counts["gemini"] + counts["audit"] + counts["shadow"],
+            "skip_rate": round(counts["skip"] / total, 3) if total else 0.0,
+            "threshold": self.threshold,
+            "enabled": self.enabled,
+            "audit_agreement": None,
+            "audit_mean_abs_score_diff": None,
+            "suggested_temperature": None,
+        }
+        if audits:
+            report["audit_agreement"] = round(sum(audit[2] for audit in audits) / len(audits), 3)
+            report["audit_mean_abs_score_diff"] = round(sum(audit[3] for audit in audits) / len(audits), 2)
+            # Con pocas auditorías la temperatura ajustada no es confiable
+            if len(audits) >= 20 and len({len(audit[0]) for audit in audits}) == 1:
+                report["suggested_temperature"] = VisionYolo.fit_temperature(
+                    [audit[0] for audit in audits], np.array(audits[0][1]), [audit[2] for audit in audits])
+        return report